@@ -6,12 +6,13 @@ from collections import defaultdict
 from pprint import pprint
 import numpy as np
 
+from src.observ.RunArchive import read_run_json, read_run_jsonl, get_run_files
+from src.observ.StateDelta import StateHistory
+
 
 def init_user_config(run: str) -> defaultdict:
     stat = defaultdict(dict)
-    game_init_path = os.path.join(os.getcwd(), run, 'game_init.json')
-    with open(game_init_path, 'r') as f:
-        init_log = json.load(f)
+    init_log = read_run_json(run, 'game_init.json')
     for player in init_log['config']['players']:
         stat[player['name']]['role'] = player['role']
     for name, agent_info in init_log['config']['agents'].items():
@@ -19,11 +20,9 @@ def init_user_config(run: str) -> defaultdict:
     return stat
 
 def get_sorted_game_log(run: str):
-    game_log_path = os.path.join(os.getcwd(), run, 'game_log.json')
-    game_log = get_jsonl(game_log_path)
-    agents_log = glob.glob(os.path.join(run, 'agents', '*', 'local_log.json'))
-    for agent_log in agents_log:
-        game_log.extend(get_jsonl(agent_log))
+    game_log = read_run_jsonl(run, 'game_log.json')
+    for agent_log in get_run_files(run, 'agents/*/local_log.json'):
+        game_log.extend(read_run_jsonl(run, agent_log))
     game_log = sorted(game_log, key=lambda x: x["dttm"])
     return game_log
 
@@ -44,10 +43,17 @@ def analyze_exp(exp_name: str) -> dict:
         first_player_in_step = ""
         cur_player = {}
         game_state = {}
+        game_states = StateHistory()
         cur_card = ""
         cur_player_name = ""
         end_of_run = False
         for event in game_log:
+            if event.get("type") == "game_state_delta":
+                game_states.add_delta(event['value'])
+                event = {"type": "game_state", "value": game_states.last()}
+            elif event.get("type") == "game_state":
+                game_states.add_keyframe(event['value'])
+
             if event.get("value"):
                 value = event['value']
 
@@ -0,0 +1,140 @@
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+from zoneinfo import ZoneInfo
+
+from omegaconf import DictConfig
+
+from src.emulator.Emulator import GameEmulator
+from src.game.Card import Card, CardID
+from src.game.Config import Config, ResolvedConfig
+from src.game.Hand import create_hand
+from src.game.Utils import get_run_seed, GameEncoder
+from src.observ.JsonlWriter import JsonlWriter, LOG_TIMEZONE
+
+
+def measure(name: str, func: Callable[[], None], iterations: int):
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+
+    # peak of temporary memory for one call: everything func allocates and drops
+    tracemalloc.start()
+    func()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<40} {elapsed / iterations * 1e9:>10.0f} ns/call {peak - before:>8} B allocated/call")
+
+
+def engine_benchmarks(config: DictConfig, iterations: int):
+    emulator = GameEmulator(config, headless=True)
+    game = emulator.game
+    player = game.current_player_state
+    opponent = game.get_player(game.get_player_names()[1])
+    bang = Card(CardID.BANG)
+
+    print("===" * 15, "Engine hot path", "===" * 15)
+    measure("Card(CardID.BANG)", lambda: Card(CardID.BANG), iterations)
+    measure("Player.has_card", lambda: player.has_card(bang), iterations)
+    measure("Player.get_health", lambda: player.get_health(), iterations)
+    measure("Player.get_state_log()['cur_hp']", lambda: player.get_state_log()['cur_hp'], iterations)
+    measure("Player.get_save/shoot_modifier",
+            lambda: opponent.get_save_modifier() - player.get_shoot_modifier(), iterations)
+    measure("Player.get_dist_modifiers", lambda: player.get_dist_modifiers(), iterations)
+    measure("Game.distance", lambda: game.distance(player.name, opponent.name), iterations)
+    measure("Game.get_reachable_opponents", lambda: game.get_reachable_opponents(player.name), iterations)
+    measure("Game.legal_actions", lambda: game.legal_actions(player), iterations)
+
+    snapshot = game.snapshot()
+    measure("Game.snapshot", lambda: game.snapshot(), iterations // 10)
+    measure("Game.restore", lambda: game.restore(snapshot), iterations // 10)
+    measure("Game.clone", lambda: game.clone(), iterations // 10)
+
+
+def hand_benchmarks(iterations: int):
+    cards = [Card(card_id) for card_id in (CardID.BANG, CardID.MISS, CardID.BEER, CardID.BANG,
+                                           CardID.PANIC, CardID.BANG, CardID.SCOFIELD, CardID.MISS)]
+    bang = Card(CardID.BANG)
+    winchester = Card(CardID.WINCHESTER)
+
+    for hand_store in ("list", "counts"):
+        hand = create_hand(cards.copy(), hand_store)
+
+        def remove_and_append():
+            hand.remove(bang)
+            hand.append(bang)
+
+        print("===" * 15, f"Hand store: {hand_store}", "===" * 15)
+        measure("card in hand (miss)", lambda: winchester in hand, iterations)
+        measure("hand.remove + hand.append", remove_and_append, iterations)
+        measure("hand.count", lambda: hand.count(bang), iterations)
+        measure("hand[len - 1]", lambda: hand[len(hand) - 1], iterations)
+        measure("hand.copy", lambda: hand.copy(), iterations)
+
+
+def log_benchmarks(config: DictConfig, iterations: int):
+    emulator = GameEmulator(config, headless=True)
+    event = {"type": "current_player_state", "value": emulator.game.current_player_state.get_state_log()}
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        # the way events were written before JsonlWriter: reopen the file for every event
+        def append_event():
+            event["dttm"] = datetime.datetime.now(ZoneInfo("Europe/Moscow"))
+            with open(os.path.join(log_dir, "append_log.json"), "a", encoding="utf-8") as f:
+                json.dump(event, f, cls=GameEncoder)
+                f.write('\n')
+
+        writer = JsonlWriter(os.path.join(log_dir, "writer_log.json"))
+
+        def write_event():
+            event["dttm"] = datetime.datetime.now(LOG_TIMEZONE)
+            writer.write(event)
+
+        print("===" * 15, "Logging", "===" * 15)
+        measure("open + json.dump per event", append_event, iterations // 10)
+        measure("JsonlWriter.write", write_event, iterations // 10)
+        writer.close()
+
+
+def game_benchmark(config: DictConfig, games: int):
+    # per-game copies of the DictConfig, and one ResolvedConfig shared by the batch like main.py --headless
+    for name, batch_config in (("DictConfig", config), ("ResolvedConfig", ResolvedConfig.create(config))):
+        base_seed = batch_config.seed
+        actions = 0
+        start = time.perf_counter()
+        for game_num in range(games):
+            emulator = GameEmulator(batch_config, headless=True, seed=get_run_seed(base_seed, game_num))
+            emulator.play_game()
+            actions += emulator.actions_count
+        elapsed = time.perf_counter() - start
+
+        print("===" * 15, f"Headless games, {name}", "===" * 15)
+        print(f"Games: {games}, actions: {actions}")
+        print(f"{games / elapsed:.1f} games/s, {actions / elapsed:.0f} actions/s, "
+              f"{elapsed / actions * 1e6:.1f} us/action")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bang engine benchmark")
+    parser.add_argument("config", type=str, help="config.yaml with dummy agents")
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--games", type=int, default=200)
+
+    args = parser.parse_args()
+
+    config = Config(f'config/{args.config}').config
+    engine_benchmarks(config, args.iterations)
+    hand_benchmarks(args.iterations)
+    log_benchmarks(config, args.iterations)
+    game_benchmark(config, args.games)
@@ -1,23 +1,95 @@
 import argparse
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+from src.agent.LlmClientRegistry import LlmClientRegistry
 from src.emulator.Emulator import GameEmulator
+from src.game.Config import Config, ResolvedConfig
+from src.game.Utils import get_run_seed
+
+
+def print_results(results: list, elapsed: float):
+    games = len(results)
+    print(f"Games: {games}, time: {elapsed:.2f}s, games per second: {games / elapsed:.1f}")
+    counts = defaultdict(int)
+    for result in results:
+        counts[result.name] += 1
+    for result, count in sorted(counts.items()):
+        print(f"{result}: {count}")
+
+
+# The config is resolved once for the whole batch, the games share it read-only
+def run_headless(config_path: str, games: int):
+    config = ResolvedConfig.create(Config(config_path).config)
+    base_seed = config.seed
+
+    results = []
+    start = time.perf_counter()
+    for game_num in range(games):
+        emulator = GameEmulator(config, headless=True, seed=get_run_seed(base_seed, game_num))
+        results.append(emulator.play_game())
+    print_results(results, time.perf_counter() - start)
+
+
+# Interleaves games in one event loop. LLM agents await the async client of the loop,
+# blocking calls of the other agents run in a pool of `concurrency` threads
+async def run_async(config_path: str, games: int, concurrency: int, headless: bool):
+    config = Config(config_path).config
+    if headless:
+        config = ResolvedConfig.create(config)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def play(game_num: int):
+        async with semaphore:
+            seed = get_run_seed(config.seed, game_num) if headless else None
+            emulator = GameEmulator(config, headless=headless, seed=seed)
+            return await emulator.async_play_game()
+
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(play(game_num) for game_num in range(games)))
+    finally:
+        await LlmClientRegistry.async_close()
+    print_results(results, time.perf_counter() - start)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Bang emulator")
-    parser.add_argument("config", type=str, help="config.yaml")
+    parser.add_argument("config", type=str, nargs="?", default=None, help="config.yaml")
+    parser.add_argument("--headless", action="store_true",
+                        help="run games without saves, logs, mlflow and console output")
+    parser.add_argument("--games", type=int, default=1, help="number of games in headless or async mode")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="play games concurrently in one process with asyncio, max number of running games")
+    parser.add_argument("--resume", type=str, default=None, metavar="RUN_DIR",
+                        help="continue an interrupted game from the last checkpoint in its save folder")
 
     args = parser.parse_args()
 
+    if args.config is None and args.resume is None:
+        parser.error("config is required unless --resume is given")
+
     print(f"Config name: {args.config}")
 
-    emulator = GameEmulator(f'config/{args.config}')
-    emulator.play_game()
+    if args.resume:
+        emulator = GameEmulator.from_checkpoint(args.resume)
+        emulator.play_game()
+    elif args.concurrency > 0:
+        asyncio.run(run_async(f'config/{args.config}', args.games, args.concurrency, args.headless))
+    elif args.headless:
+        run_headless(f'config/{args.config}', args.games)
+    else:
+        emulator = GameEmulator(f'config/{args.config}')
+        emulator.play_game()
+
+    for client, stats in LlmClientRegistry.get_stats().items():
+        print(f"LLM client {client}: {stats}")
 
 
 # from src.gui.BangGUI import BangGUI
 #
 # if __name__ == '__main__':
 #     gui = BangGUI('config/config.yaml')
-
-
-
@@ -1,25 +1,30 @@
-import json
 import os.path
 import argparse
 
-from glob import glob
 from pprint import pprint
 
+from src.observ.RunArchive import read_run_jsonl, get_run_files
+from src.observ.StateDelta import StateHistory
+
 
 def read_game(path: str):
-    game_log_path = os.path.join(path, 'game_log.json')
-    shared_memory_log_path = os.path.join(path, 'shared_memory_log.json')
-    agents = glob(os.path.join(path, 'agents', '*', 'local_log.json'))
-    game_log = get_game_history(game_log_path)
-    game_log += get_communications(shared_memory_log_path)
-    for agent in agents:
-        game_log.extend(get_player_history(agent))
+    game_log = read_run_jsonl(path, 'game_log.json')
+    game_log += get_communications(path)
+    for agent in get_run_files(path, 'agents/*/local_log.json'):
+        game_log.extend(get_player_history(path, agent))
     game_log = sorted(game_log, key=lambda x: x["dttm"])
+    game_states = StateHistory()
     game_state_counter = 0
     final_log = []
     for log_event in game_log:
         del log_event["dttm"]
         event_type = log_event.get("type")
+        if event_type == "game_state_delta":
+            game_states.add_delta(log_event["value"])
+            event_type = "game_state"
+            log_event = {"type": event_type, "value": game_states.last()}
+        elif event_type == "game_state":
+            game_states.add_keyframe(log_event["value"])
         if event_type:
             if event_type == "game_state":
                 game_state_counter += 1
@@ -50,39 +55,36 @@ def read_game(path: str):
             print("<<<<<<<<<<NEW DATA!!!>>>>>>>>>>>")
             counter = 0
 
-def get_game_history(path):
-    data = []
-    with open(path, 'r') as f:
-        for line in f:
-            if line.strip():
-                data.append(json.loads(line))
-    return data
+def read_game_state(path: str, index: int):
+    game_states = StateHistory()
+    for log_event in read_run_jsonl(path, 'game_log.json'):
+        match log_event["type"]:
+            case "game_state":
+                game_states.add_keyframe(log_event["value"])
+            case "game_state_delta":
+                game_states.add_delta(log_event["value"])
+    print(f"Game state {index} of {len(game_states)}")
+    pprint(game_states.get(index))
 
 def get_communications(path):
-    data = []
-    with open(path, 'r') as f:
-        for line in f:
-            if line.strip():
-                log = json.loads(line)
-                if log["type"]["name"] == "PLAYER_SAY":
-                    data.append(log)
-    return data
+    return [log for log in read_run_jsonl(path, 'shared_memory_log.json') if log["type"]["name"] == "PLAYER_SAY"]
 
-def get_player_history(path):
-    data = []
-    name = path.split("\\")[-2].title()
-    with open(path, 'r') as f:
-        for line in f:
-            if line.strip():
-                log = json.loads(line)
-                log["name"] = name
-                data.append(log)
+def get_player_history(path, agent_log):
+    name = agent_log.split("/")[-2].title()
+    data = read_run_jsonl(path, agent_log)
+    for log in data:
+        log["name"] = name
     return data
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Bang viewer")
     parser.add_argument("exp", type=str)
     parser.add_argument("run", type=str)
+    parser.add_argument("--state", type=int, default=None,
+                        help="print only the game state with this number (negative - from the end)")
 
     args = parser.parse_args()
-    read_game(os.path.join('save', args.exp, args.run))
\ No newline at end of file
+    if args.state is not None:
+        read_game_state(os.path.join('save', args.exp, args.run), args.state)
+    else:
+        read_game(os.path.join('save', args.exp, args.run))
\ No newline at end of file
@@ -0,0 +1,59 @@
+import argparse
+import sys
+import time
+from pprint import pprint
+
+from omegaconf import OmegaConf
+
+from src.emulator.Replay import GameReplay, replay_with_agents
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recorded run without agents and fork it from any step")
+    parser.add_argument("run", type=str, help="save folder of the run, e.g. save/<exp>/<run_id>")
+    parser.add_argument("--step", type=int, default=None, help="replay up to this step (number of played cards)")
+    parser.add_argument("--fork", action="store_true", help="continue the game from the step with agents")
+    parser.add_argument("--override", type=str, default=None,
+                        help="yaml merged into the run config for the fork, e.g. with other agents")
+    parser.add_argument("--exp", type=str, default=None,
+                        help="experiment of the fork or the --agents run, <exp>_fork / <exp>_offline_<run> by default")
+    parser.add_argument("--agents", action="store_true",
+                        help="play the run again with its agents, LLM answers are taken from their local logs")
+    parser.add_argument("--legacy", action="store_true",
+                        help="with --agents: runs recorded before the legal move checks, answers in recorded order")
+    parser.add_argument("--headless", action="store_true",
+                        help="play the fork or the --agents run without saves, logs and mlflow")
+    parser.add_argument("--strict", action="store_true",
+                        help="stop with an error when a seeded run needs a resync or ends with another result")
+
+    args = parser.parse_args()
+
+    if args.agents:
+        emulator = replay_with_agents(args.run, args.exp, args.headless, args.legacy)
+        start = time.perf_counter()
+        try:
+            game_result = emulator.play_game()
+        except Exception as e:
+            print(f"Replay stopped after {emulator.actions_count} steps: {type(e).__name__}: {e}")
+            sys.exit(1)
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {emulator.actions_count} steps with the agents in {elapsed:.3f}s")
+        print(f"Game result: {game_result.name}")
+    else:
+        replay = GameReplay(args.run, args.strict)
+        start = time.perf_counter()
+        try:
+            game_result = replay.replay(args.step)
+        except Exception as e:
+            print(f"Replay stopped after {replay.step} steps: {type(e).__name__}: {e}")
+            sys.exit(1)
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {replay.step} steps in {elapsed:.3f}s, resyncs with the log: {replay.resyncs}")
+
+        if args.fork:
+            override = OmegaConf.load(args.override) if args.override else None
+            emulator = replay.fork(override, args.exp, args.headless)
+            print(f"Fork result: {emulator.play_game().name}")
+        else:
+            print(f"Game result: {game_result.name}")
+            pprint(replay.game.players_game_state)
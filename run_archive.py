@@ -0,0 +1,47 @@
+import argparse
+import os.path
+
+from src.observ.RunArchive import ARCHIVE_NAME, pack_run, unpack_run
+
+
+def get_runs(exp: str, run: str = None) -> list[str]:
+    base_path = os.path.join('save', exp)
+    if run:
+        return [os.path.join(base_path, run)]
+    return sorted(entry.path for entry in os.scandir(base_path) if entry.is_dir())
+
+
+def pack(exp: str, run: str = None, remove: bool = False):
+    for run_path in get_runs(exp, run):
+        if os.path.exists(os.path.join(run_path, ARCHIVE_NAME)):
+            print(f"{run_path}: already packed")
+            continue
+        size = sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, files in os.walk(run_path) for file_name in files)
+        archive_path = pack_run(run_path, remove)
+        print(f"{run_path}: {size} -> {os.path.getsize(archive_path)} bytes")
+
+
+def unpack(exp: str, run: str = None, remove: bool = False):
+    for run_path in get_runs(exp, run):
+        if not os.path.exists(os.path.join(run_path, ARCHIVE_NAME)):
+            print(f"{run_path}: not packed")
+            continue
+        unpack_run(run_path, remove)
+        print(f"{run_path}: unpacked")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert runs between JSON logs and a single run archive")
+    parser.add_argument("command", choices=["pack", "unpack"])
+    parser.add_argument("exp", type=str)
+    parser.add_argument("run", type=str, nargs="?", default=None, help="one run of the experiment, all by default")
+    parser.add_argument("--remove", action="store_true",
+                        help="remove the source files (JSON logs for pack, the archive for unpack)")
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack(args.exp, args.run, args.remove)
+    else:
+        unpack(args.exp, args.run, args.remove)
@@ -0,0 +1,66 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+from src.emulator.Emulator import GameEmulator
+from src.game.Config import Config
+from src.game.Game import GameResult
+from src.observ.GameExperimentLogger import GameExperimentLogger
+
+
+def play_run(config_path: str, run_index: int, verbose: bool) -> str:
+    if verbose:
+        return GameEmulator(config_path, run_index=run_index).play_game().name
+    # the game is fully logged to its run directory, the console output of parallel runs is dropped
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return GameEmulator(config_path, run_index=run_index).play_game().name
+
+
+def run_experiment(config_path: str, runs: int, workers: int, verbose: bool):
+    config = Config(config_path).config
+    # the parent checks exp_hash.txt and hands out run indexes, so parallel runs never share a seed
+    first_run_index = GameExperimentLogger.prepare_experiment(config)
+    print(f"Experiment: {config.exp_name}, runs: {first_run_index}..{first_run_index + runs - 1}, workers: {workers}")
+
+    results = defaultdict(int)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(play_run, config_path, run_index, verbose): run_index
+                   for run_index in range(first_run_index, first_run_index + runs)}
+        for future in as_completed(futures):
+            run_index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = "FAILED"
+                print(f"Run {run_index} failed: {e!r}")
+            results[result] += 1
+            print(f"Run {run_index}: {result} ({sum(results.values())}/{runs})")
+    elapsed = time.perf_counter() - start
+
+    print("===" * 15, "Experiment result", "===" * 15)
+    print(f"Runs: {runs}, time: {elapsed:.1f}s")
+    for result, count in sorted(results.items()):
+        print(f"{result}: {count}")
+
+    metrics = {result.name: results[result.name] for result in GameResult if result != GameResult.NO_WINNERS}
+    metrics["FAILED"] = results["FAILED"]
+    metrics["time_s"] = elapsed
+    GameExperimentLogger.log_experiment_summary(config, {"first_run_index": first_run_index, "runs": runs,
+                                                         "workers": workers}, metrics)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run several games of one experiment in parallel")
+    parser.add_argument("config", type=str, help="config.yaml")
+    parser.add_argument("--runs", type=int, default=1, help="number of games to play")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--verbose", action="store_true", help="keep the console output of the games")
+
+    args = parser.parse_args()
+
+    run_experiment(f'config/{args.config}', args.runs, args.workers, args.verbose)
@@ -1,37 +1,69 @@
+import asyncio
 import json
 import os.path
 import datetime
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any
-from zoneinfo import ZoneInfo
-
-from openai import OpenAI
+from typing import Any, Generator, Optional
 
+from src.agent.LlmCache import LlmCache, LlmCacheMode, CachedClient
+from src.agent.LlmClientRegistry import LlmClientRegistry
+from src.agent.LlmGateway import LlmGateway, TokenBucketLimiter
+from src.agent.LlmUsage import LlmUsage, LLM_CALLS_NAME, get_response_usage
+from src.agent.ReplayClient import ReplayClient
 from src.game.Card import Card
 from src.emulator.LoggedList import LoggedList, SavePath
 from src.game.Game import Game
 from src.game.Player import Player
 from src.game.Utils import GameEncoder
+from src.observ.JsonlWriter import JsonlWriter, LOG_TIMEZONE
 
 class AgentType(Enum):
     DEEPSEEK = 0
 
 
-def init_agent(agent_type: AgentType = AgentType.DEEPSEEK):
+# The clients come from the process-wide registry, agents of all games share their connection pools.
+# The async client is the one of the running event loop
+def init_agent(agent_type: AgentType = AgentType.DEEPSEEK, async_client: bool = False,
+               pool: Optional[dict[str, Any]] = None):
     client = None
     match agent_type:
         case AgentType.DEEPSEEK:
             deepseek_api_key = os.getenv('DEEPSEEK_KEY', "empty")
             if deepseek_api_key == "empty":
                 raise Exception("Add api key to env variable DEEPSEEK_KEY")
-            client = OpenAI(
-                api_key= deepseek_api_key,
-                base_url="https://api.deepseek.com"
-            )
+            get_client = LlmClientRegistry.get_async if async_client else LlmClientRegistry.get
+            client = get_client("deepseek", "https://api.deepseek.com", deepseek_api_key, pool)
     return client
 
 
+# The API client behind the rate limiter and retries of llm_rate_limit and llm_retry
+def init_llm_gateway(config: dict[str, Any]) -> LlmGateway:
+    limiter = None
+    rate_limit = config.get("llm_rate_limit") or {}
+    if rate_limit.get("rpm", 0) or rate_limit.get("tpm", 0):
+        limiter = TokenBucketLimiter.get(rate_limit.get("rpm", 0), rate_limit.get("tpm", 0),
+                                         rate_limit.get("backend", "thread"), rate_limit.get("state_path"))
+    retry = config.get("llm_retry") or {}
+    return LlmGateway(init_agent(pool=config.get("llm_pool")), limiter, retry.get("max_retries", 6),
+                      retry.get("base_delay", 1.0), retry.get("max_delay", 60.0),
+                      lambda: init_agent(async_client=True, pool=config.get("llm_pool")))
+
+
+# LLM client of an agent: the API, or the answers recorded in the run from llm_replay_run (offline replay).
+# Cached answers don't go through the gateway, the API client is created on the first miss
+def init_llm_client(config: dict[str, Any], agent_name: str, agent: str = None):
+    replay_run = config.get("llm_replay_run")
+    if replay_run:
+        return ReplayClient(replay_run, agent_name, agent, config.get("llm_replay_legacy", False))
+    cache_mode = config.get("llm_cache")
+    if cache_mode:
+        cache = LlmCache.get(config.get("llm_cache_path", "save/llm_cache.sqlite"),
+                             int(config.get("llm_cache_max_mb", 1024) * 1024 * 1024))
+        return CachedClient(cache, LlmCacheMode(cache_mode), lambda: init_llm_gateway(config))
+    return init_llm_gateway(config)
+
+
 class Agent(ABC):
     def __init__(self, agent_name: str,
                  config: dict[str, Any],
@@ -40,17 +72,23 @@ class Agent(ABC):
                  shared_memory: LoggedList):
         self.name = agent_name
         self.agent_config = config["agents"][self.name]
+        self.headless = config.get("headless", False)
         self.__agent_log_path = os.path.join(config["save_path"], "agents", self.name)
-        os.makedirs(self.__agent_log_path)
-        self.__local_log = LoggedList(self._save_local_memory, SavePath.LOCAL_MEMORY)
+        if not self.headless:
+            os.makedirs(self.__agent_log_path, exist_ok=config.get("resume", False))
+        self.__log_writers = {}
+        self.__local_log = LoggedList(self._save_local_memory, SavePath.LOCAL_MEMORY, gui=config.get("gui", False))
         self.__shared_memory = shared_memory
         self.__last_shared_memory_index = len(shared_memory)
         self.player = player # only for read purpose
         self.game = game # only for read purpose
+        self.llm_usage = LlmUsage(config.get("llm_prices"))
+        # the method the emulator asked the agent last, its LLM calls are accounted to it
+        self.decision = None
 
     @property
     def player_hand(self):
-        return self.player.get_state_log()["hand"]
+        return self.player.get_hand()
 
     @property
     def local_log(self):
@@ -77,18 +115,56 @@ class Agent(ABC):
         }
 
     def _save_local_memory(self, data: dict[str, Any], file_name: str):
-        data["dttm"] = datetime.datetime.now(ZoneInfo("Europe/Moscow"))
-        log_file = os.path.join(self.__agent_log_path, file_name)
-        with open(log_file, "a", encoding="utf-8") as f:
-            json.dump(data, f, cls=GameEncoder)
-            f.write('\n')
+        if self.headless:
+            return
+        data["dttm"] = datetime.datetime.now(LOG_TIMEZONE)
+        writer = self.__log_writers.get(file_name)
+        if writer is None:
+            writer = JsonlWriter(os.path.join(self.__agent_log_path, file_name))
+            self.__log_writers[file_name] = writer
+        writer.write(data)
+
+    def close_logs(self):
+        for writer in self.__log_writers.values():
+            writer.close()
+        self.__log_writers = {}
+
+    def get_log_offsets(self) -> dict[str, int]:
+        return {writer.path: writer.tell() for writer in self.__log_writers.values()}
+
+    # Tokens and latency of one LLM call, `stage` is the sub-agent (or pipeline step) that made it.
+    # Prompt characters are counted for the answers of the API only, they calibrate TokenEstimator
+    def _record_llm_call(self, stage: str, model: str, messages: list[dict[str, str]], response: Any,
+                         latency: float):
+        usage = get_response_usage(response)
+        if usage["prompt_tokens"]:
+            usage["prompt_chars"] = sum(len(message["content"]) for message in messages)
+        call = self.llm_usage.add(stage, self.decision, usage, latency)
+        self._save_local_memory({"decision": self.decision, "stage": stage, "model": model, **call}, LLM_CALLS_NAME)
+
+    # Counters summed over all agents into the run metrics
+    def get_metrics(self) -> dict[str, int]:
+        return {}
+
+    # Everything the agent needs to continue the game from a checkpoint, subclasses add their own state
+    def get_checkpoint(self) -> dict[str, Any]:
+        return {"last_shared_memory_index": self.__last_shared_memory_index,
+                "local_log": list(self.__local_log),
+                "llm_usage": self.llm_usage.as_dict()}
+
+    def restore_checkpoint(self, checkpoint: dict[str, Any]):
+        self.__last_shared_memory_index = checkpoint["last_shared_memory_index"]
+        # slice assignment fills the list without writing the events to the log again
+        self.__local_log[:] = checkpoint["local_log"]
+        if "llm_usage" in checkpoint:
+            self.llm_usage.restore(checkpoint["llm_usage"])
 
     @abstractmethod
     def choice_card_for_play(self) -> str:
         pass
 
     @abstractmethod
-    def get_opponent(self, card: Card) -> str:
+    def get_opponent(self, card: Card, opponents: list[str]) -> str:
         pass
 
     @abstractmethod
@@ -118,3 +194,139 @@ class Agent(ABC):
     @abstractmethod
     def react_to_discard_error(self, errors: str):
         pass
+
+    # Async versions of the decisions used by GameEmulator.async_play_game.
+    # By default they run the blocking method in a worker thread,
+    # LlmAgent awaits its LLM calls instead
+    async def async_choice_card_for_play(self) -> str:
+        return await self._async_decide("choice_card_for_play")
+
+    async def async_get_opponent(self, card: Card, opponents: list[str]) -> str:
+        return await self._async_decide("get_opponent", card, opponents)
+
+    async def async_get_action_type(self, card: Card, options: dict) -> str:
+        return await self._async_decide("get_action_type", card, options)
+
+    async def async_get_card_for_steal(self, card: Card, options: dict) -> str:
+        return await self._async_decide("get_card_for_steal", card, options)
+
+    async def async_get_indians_response(self) -> str:
+        return await self._async_decide("get_indians_response")
+
+    async def async_get_bang_response(self) -> str:
+        return await self._async_decide("get_bang_response")
+
+    async def async_get_gatling_response(self) -> str:
+        return await self._async_decide("get_gatling_response")
+
+    async def async_get_card_for_discard(self, num_cards: int) -> str:
+        return await self._async_decide("get_card_for_discard", num_cards)
+
+    async def async_react_to_discard_error(self, errors: str):
+        return await self._async_decide("react_to_discard_error", errors)
+
+    async def _async_decide(self, method: str, *args) -> Any:
+        return await asyncio.to_thread(getattr(self, method), *args)
+
+
+# Agent whose decisions are generators that yield their LLM calls instead of making them, like the game loop
+# of GameEmulator. The blocking decision methods make the calls with client.chat.completions.create,
+# the async ones await client.async_create in the event loop, so LLM agents of async games need no threads
+class LlmAgent(Agent, ABC):
+    @staticmethod
+    def _llm_request(client: Any, **kwargs) -> Generator[dict[str, Any], Any, Any]:
+        return (yield {"client": client, "kwargs": kwargs})
+
+    @staticmethod
+    def _run_llm(steps: Generator[dict[str, Any], Any, Any]) -> Any:
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    response = request["client"].chat.completions.create(**request["kwargs"])
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(response)
+        except StopIteration as e:
+            return e.value
+
+    @staticmethod
+    async def _async_run_llm(steps: Generator[dict[str, Any], Any, Any]) -> Any:
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    response = await request["client"].async_create(**request["kwargs"])
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(response)
+        except StopIteration as e:
+            return e.value
+
+    async def _async_decide(self, method: str, *args) -> Any:
+        return await self._async_run_llm(getattr(self, f"{method}_steps")(*args))
+
+    def choice_card_for_play(self) -> str:
+        return self._run_llm(self.choice_card_for_play_steps())
+
+    def get_opponent(self, card: Card, opponents: list[str]) -> str:
+        return self._run_llm(self.get_opponent_steps(card, opponents))
+
+    def get_action_type(self, card: Card, options: dict) -> str:
+        return self._run_llm(self.get_action_type_steps(card, options))
+
+    def get_card_for_steal(self, card: Card, options: dict) -> str:
+        return self._run_llm(self.get_card_for_steal_steps(card, options))
+
+    def get_indians_response(self) -> str:
+        return self._run_llm(self.get_indians_response_steps())
+
+    def get_bang_response(self) -> str:
+        return self._run_llm(self.get_bang_response_steps())
+
+    def get_gatling_response(self) -> str:
+        return self._run_llm(self.get_gatling_response_steps())
+
+    def get_card_for_discard(self, num_cards: int) -> str:
+        return self._run_llm(self.get_card_for_discard_steps(num_cards))
+
+    def react_to_discard_error(self, errors: str):
+        return self._run_llm(self.react_to_discard_error_steps(errors))
+
+    @abstractmethod
+    def choice_card_for_play_steps(self) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_opponent_steps(self, card: Card, opponents: list[str]) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_action_type_steps(self, card: Card, options: dict) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_card_for_steal_steps(self, card: Card, options: dict) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_indians_response_steps(self) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_bang_response_steps(self) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_gatling_response_steps(self) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def get_card_for_discard_steps(self, num_cards: int) -> Generator[dict[str, Any], Any, str]:
+        pass
+
+    @abstractmethod
+    def react_to_discard_error_steps(self, errors: str) -> Generator[dict[str, Any], Any, None]:
+        pass
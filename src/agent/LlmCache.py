@@ -0,0 +1,166 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from enum import Enum
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+
+# events in the prompts carry the wall clock time, a rerun of the same game differs only in it
+DTTM_PATTERN = re.compile(r'"dttm": "[^"]*"')
+
+
+class LlmCacheMode(Enum):
+    READ_THROUGH = "read_through"  # cached answer if any, otherwise the API and save the answer
+    WRITE_THROUGH = "write_through"  # always the API, the answer replaces the cached one
+    REPLAY_ONLY = "replay_only"  # only cached answers, a miss is an error
+
+
+# Answers of the LLM API on disk (SQLite), keyed by a hash of model, messages (without the event times),
+# temperature and max_tokens. One file is shared by threads and processes, SQLite locks it.
+# When the answers take more than max_size bytes, the least recently used ones are removed
+class LlmCache:
+    __caches = {}
+    __caches_lock = threading.Lock()
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, model TEXT, "
+                                  "answer TEXT, size INTEGER, created REAL, last_used REAL)")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self.__size = self.__get_size()
+
+    # One cache per file in the process, agents of all games share the connection
+    @staticmethod
+    def get(path: str, max_size: int) -> "LlmCache":
+        with LlmCache.__caches_lock:
+            cache = LlmCache.__caches.get(path)
+            if cache is None:
+                cache = LlmCache(path, max_size)
+                LlmCache.__caches[path] = cache
+            return cache
+
+    @staticmethod
+    def get_key(model: str, messages: list[dict[str, str]], temperature: float, max_tokens: int) -> str:
+        messages = [{**message, "content": DTTM_PATTERN.sub('"dttm": ""', message["content"])}
+                    for message in messages]
+        request = json.dumps({"model": model, "messages": messages, "temperature": temperature,
+                              "max_tokens": max_tokens}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> Optional[str]:
+        with self.__lock:
+            row = self.__connection.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.__connection.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def save(self, key: str, model: str, answer: str):
+        size = len(answer.encode("utf-8"))
+        now = time.time()
+        with self.__lock:
+            # an answer saved again (write_through, or a miss of two games at once) replaces the old one,
+            # only the difference is added to the size
+            self.__connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.__connection.execute("SELECT size FROM answers WHERE key = ?", (key,)).fetchone()
+                self.__connection.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                                          (key, model, answer, size, now, now))
+                self.__connection.execute("COMMIT")
+            except Exception:
+                self.__connection.execute("ROLLBACK")
+                raise
+            self.__size += size - (row[0] if row is not None else 0)
+            if self.__size > self.max_size:
+                self.__evict()
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def __get_size(self) -> int:
+        return self.__connection.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+
+    # other processes write to the same file, so the size is counted again before removing anything
+    def __evict(self):
+        self.__size = self.__get_size()
+        while self.__size > self.max_size * 0.9:
+            rows = self.__connection.execute("SELECT key, size FROM answers ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                break
+            self.__connection.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key, _ in rows])
+            self.__size -= sum(size for _, size in rows)
+
+
+# Client with the interface of the OpenAI client (client.chat.completions.create) that answers from LlmCache,
+# async_create awaits the async call of the API client on a miss.
+# The API client is created by `client_factory` on the first miss, so replay_only runs don't need the API key.
+# hits/misses are counted per agent and logged as run metrics
+class CachedClient:
+    def __init__(self, cache: LlmCache, mode: LlmCacheMode, client_factory: Callable[[], Any]):
+        self.cache = cache
+        self.mode = mode
+        self.__client_factory = client_factory
+        self.__client = None
+        self.hits = 0
+        self.misses = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list[dict[str, str]], temperature: float, max_tokens: int,
+               **kwargs) -> Any:
+        key, response = self.__load(model, messages, temperature, max_tokens)
+        if response is None:
+            response = self.__get_client().chat.completions.create(model=model, messages=messages,
+                                                                   temperature=temperature, max_tokens=max_tokens,
+                                                                   **kwargs)
+            self.__save(key, model, response)
+        return response
+
+    async def async_create(self, model: str, messages: list[dict[str, str]], temperature: float, max_tokens: int,
+                           **kwargs) -> Any:
+        key, response = self.__load(model, messages, temperature, max_tokens)
+        if response is None:
+            response = await self.__get_client().async_create(model=model, messages=messages,
+                                                              temperature=temperature, max_tokens=max_tokens,
+                                                              **kwargs)
+            self.__save(key, model, response)
+        return response
+
+    def __load(self, model: str, messages: list[dict[str, str]], temperature: float,
+               max_tokens: int) -> tuple[str, Any]:
+        key = LlmCache.get_key(model, messages, temperature, max_tokens)
+        if self.mode != LlmCacheMode.WRITE_THROUGH:
+            answer = self.cache.load(key)
+            if answer is not None:
+                self.hits += 1
+                return key, SimpleNamespace(model=model, usage=None,
+                                            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant",
+                                                                                             content=answer))])
+        self.misses += 1
+        if self.mode == LlmCacheMode.REPLAY_ONLY:
+            raise Exception(f"No cached LLM answer in {self.cache.path} for the request (llm_cache: replay_only)")
+        return key, None
+
+    def __get_client(self) -> Any:
+        if self.__client is None:
+            self.__client = self.__client_factory()
+        return self.__client
+
+    def __save(self, key: str, model: str, response: Any):
+        answer = response.choices[0].message.content
+        if answer is not None:
+            self.cache.save(key, model, answer)
+
+    def get_metrics(self) -> dict[str, float]:
+        metrics = {"llm_cache_hits": self.hits, "llm_cache_misses": self.misses}
+        if self.__client is not None:
+            metrics.update(self.__client.get_metrics())
+        return metrics
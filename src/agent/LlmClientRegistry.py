@@ -0,0 +1,183 @@
+import asyncio
+import threading
+from typing import Any, Optional
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+DEFAULT_POOL = {
+    "max_connections": 64,
+    "max_keepalive_connections": 32,
+    "keepalive_expiry": 120,  # seconds, agents of a game ask the LLM one after another with pauses
+    "timeout": 300,
+}
+
+
+class PoolStats:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.handed_out = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failed = 0
+        self.opened = 0
+        self.__sockets = []
+
+    # Sockets of the connections opened by the pool, closed ones (fileno -1) are dropped
+    def add_socket(self, sock: Any, new_connection: bool):
+        with self.__lock:
+            self.opened += new_connection
+            self.__sockets = [s for s in self.__sockets if s.fileno() != -1 and s is not sock] + [sock]
+
+    def start_request(self):
+        with self.__lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end_request(self, failed: bool):
+        with self.__lock:
+            self.in_flight -= 1
+            self.failed += failed
+
+    def as_dict(self) -> dict[str, int]:
+        with self.__lock:
+            self.__sockets = [s for s in self.__sockets if s.fileno() != -1]
+            return {"handed_out": self.handed_out, "requests": self.requests, "in_flight": self.in_flight,
+                    "max_in_flight": self.max_in_flight, "failed": self.failed, "opened": self.opened,
+                    "connections": len(self.__sockets),
+                    "idle_connections": max(len(self.__sockets) - self.in_flight, 0)}
+
+
+# New connections of a pool are seen through the trace extension of httpcore: connect_tcp and start_tls
+# return the stream of the connection, the sync TLS one replaces the plain socket (which gets fileno -1)
+def count_connection(stats: PoolStats, event_name: str, info: dict[str, Any]):
+    if event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        sock = info["return_value"].get_extra_info("socket")
+        if sock is not None:
+            stats.add_socket(sock, event_name == "connection.connect_tcp.complete")
+
+
+# httpx transports that count the requests going through their connection pool
+class CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        user_trace = request.extensions.get("trace")
+
+        def trace(event_name: str, info: dict[str, Any]):
+            count_connection(self.stats, event_name, info)
+            if user_trace is not None:
+                user_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.stats.start_request()
+        failed = True
+        try:
+            response = super().handle_request(request)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.stats.end_request(failed)
+
+
+class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        user_trace = request.extensions.get("trace")
+
+        # the async interface of httpcore awaits the trace callback
+        async def trace(event_name: str, info: dict[str, Any]):
+            count_connection(self.stats, event_name, info)
+            if user_trace is not None:
+                await user_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.stats.start_request()
+        failed = True
+        try:
+            response = await super().handle_async_request(request)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.stats.end_request(failed)
+
+
+# One OpenAI client per provider and base_url in the process instead of one per agent,
+# so all agents and all games of the process share one HTTP connection pool with warm keep-alive connections.
+# The sync client is safe to use from several threads. The async one (AsyncOpenAI) belongs to the event loop
+# it was created in, the async games of the loop await it directly; there is one per provider, base_url and loop.
+# The pool settings of the first request win.
+# The clients don't retry, LlmGateway retries the calls of the agents
+class LlmClientRegistry:
+    __clients = {}
+    __transports = {}
+    __lock = threading.Lock()
+
+    @staticmethod
+    def get(provider: str, base_url: str, api_key: str, pool: Optional[dict[str, Any]] = None) -> OpenAI:
+        return LlmClientRegistry.__get((provider, base_url, None), api_key, pool)
+
+    # must be called in the running event loop that will await the client
+    @staticmethod
+    def get_async(provider: str, base_url: str, api_key: str, pool: Optional[dict[str, Any]] = None) -> AsyncOpenAI:
+        return LlmClientRegistry.__get((provider, base_url, asyncio.get_running_loop()), api_key, pool)
+
+    @staticmethod
+    def __get(key: tuple, api_key: str, pool: Optional[dict[str, Any]]) -> OpenAI | AsyncOpenAI:
+        provider, base_url, loop = key
+        with LlmClientRegistry.__lock:
+            client = LlmClientRegistry.__clients.get(key)
+            if client is None:
+                pool = {**DEFAULT_POOL, **(pool or {})}
+                limits = httpx.Limits(max_connections=pool["max_connections"],
+                                      max_keepalive_connections=pool["max_keepalive_connections"],
+                                      keepalive_expiry=pool["keepalive_expiry"])
+                timeout = httpx.Timeout(pool["timeout"], connect=10)
+                if loop is None:
+                    transport = CountingTransport(PoolStats(), limits=limits)
+                    client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                    http_client=httpx.Client(transport=transport, timeout=timeout,
+                                                             follow_redirects=True))
+                else:
+                    transport = AsyncCountingTransport(PoolStats(), limits=limits)
+                    client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                         http_client=httpx.AsyncClient(transport=transport, timeout=timeout,
+                                                                       follow_redirects=True))
+                LlmClientRegistry.__clients[key] = client
+                LlmClientRegistry.__transports[key] = transport
+            LlmClientRegistry.__transports[key].stats.handed_out += 1
+            return client
+
+    # Requests of every client and the connections of its pool (opened in total, open and idle right now)
+    @staticmethod
+    def get_stats() -> dict[str, dict[str, int]]:
+        with LlmClientRegistry.__lock:
+            return {f"{provider} {base_url}{'' if loop is None else ' async'}": transport.stats.as_dict()
+                    for (provider, base_url, loop), transport in LlmClientRegistry.__transports.items()}
+
+    # The stats of closed clients are kept for get_stats
+    @staticmethod
+    def close():
+        with LlmClientRegistry.__lock:
+            for (provider, base_url, loop), client in list(LlmClientRegistry.__clients.items()):
+                if loop is None:
+                    client.close()
+                    del LlmClientRegistry.__clients[(provider, base_url, loop)]
+
+    # Closes the async clients of the running loop, before the loop ends
+    @staticmethod
+    async def async_close():
+        loop = asyncio.get_running_loop()
+        with LlmClientRegistry.__lock:
+            clients = [(key, client) for key, client in LlmClientRegistry.__clients.items() if key[2] is loop]
+            for key, _ in clients:
+                del LlmClientRegistry.__clients[key]
+        for _, client in clients:
+            await client.close()
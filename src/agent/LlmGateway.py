@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+import openai
+
+
+# Token buckets for requests and tokens per minute. Both refill continuously up to one minute of budget.
+# The thread backend limits the calls of this process, the file backend keeps the buckets in a state file
+# locked with fcntl (msvcrt on Windows), so all processes on the machine (e.g. the workers of run_experiment.py)
+# share the limits
+class TokenBucketLimiter:
+    __limiters = {}
+    __limiters_lock = threading.Lock()
+
+    def __init__(self, rpm: float, tpm: float, backend: str = "thread", state_path: Optional[str] = None):
+        if backend not in ("thread", "file"):
+            raise Exception(f"Unknown rate limiter backend {backend}, use thread or file")
+        if backend == "file" and not state_path:
+            raise Exception("The file rate limiter backend needs state_path")
+        self.rpm = rpm
+        self.tpm = tpm
+        self.backend = backend
+        self.state_path = state_path
+        if backend == "file" and os.path.dirname(state_path):
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__state = None
+
+    # One limiter per settings in the process, agents of all games take from the same buckets
+    @staticmethod
+    def get(rpm: float, tpm: float, backend: str = "thread",
+            state_path: Optional[str] = None) -> "TokenBucketLimiter":
+        key = (rpm, tpm, backend, state_path)
+        with TokenBucketLimiter.__limiters_lock:
+            limiter = TokenBucketLimiter.__limiters.get(key)
+            if limiter is None:
+                limiter = TokenBucketLimiter(rpm, tpm, backend, state_path)
+                TokenBucketLimiter.__limiters[key] = limiter
+            return limiter
+
+    # Blocks until one request and `tokens` tokens are available, returns the time waited
+    def acquire(self, tokens: int) -> float:
+        # a request larger than the whole budget would wait forever
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        waited = 0.0
+        while True:
+            wait = self.__update(lambda state: self.__take(state, tokens))
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    # acquire for the async games, the wait doesn't block the event loop
+    async def async_acquire(self, tokens: int) -> float:
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        waited = 0.0
+        while True:
+            wait = self.__update(lambda state: self.__take(state, tokens))
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    # The real number of tokens is known after the answer, the difference goes back to (or from) the bucket
+    def settle(self, reserved: int, used: int):
+        if self.tpm:
+            reserved = min(reserved, self.tpm)
+            self.__update(lambda state: state.update(tokens=min(state["tokens"] + reserved - used, self.tpm)))
+
+    def __take(self, state: dict[str, float], tokens: int) -> float:
+        wait = 0.0
+        if self.rpm and state["requests"] < 1:
+            wait = (1 - state["requests"]) * 60 / self.rpm
+        if self.tpm and state["tokens"] < tokens:
+            wait = max(wait, (tokens - state["tokens"]) * 60 / self.tpm)
+        if wait <= 0:
+            state["requests"] -= 1
+            state["tokens"] -= tokens
+        return wait
+
+    def __refill(self, state: Optional[dict[str, float]]) -> dict[str, float]:
+        now = time.time()
+        if state is None:
+            return {"requests": self.rpm, "tokens": self.tpm, "time": now}
+        elapsed = max(now - state["time"], 0)
+        state["requests"] = min(state["requests"] + elapsed * self.rpm / 60, self.rpm)
+        state["tokens"] = min(state["tokens"] + elapsed * self.tpm / 60, self.tpm)
+        state["time"] = now
+        return state
+
+    def __update(self, change: Callable[[dict[str, float]], Any]) -> Any:
+        if self.backend == "thread":
+            with self.__lock:
+                self.__state = self.__refill(self.__state)
+                return change(self.__state)
+
+        # every call opens the file, so threads of the process exclude each other with the file lock too
+        with open(self.state_path, "a+", encoding="utf-8") as f:
+            TokenBucketLimiter.__lock_file(f)
+            try:
+                f.seek(0)
+                data = f.read()
+                state = self.__refill(json.loads(data) if data else None)
+                result = change(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                TokenBucketLimiter.__unlock_file(f)
+
+    # fcntl exists only on Unix, msvcrt only on Windows, so they are imported where the lock is taken
+    @staticmethod
+    def __lock_file(f):
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # the first byte of the file, LK_LOCK gives up after 10 seconds of waiting
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    return
+                except OSError:
+                    continue
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+    @staticmethod
+    def __unlock_file(f):
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Every call of an agent to the LLM API goes through the gateway: it waits for the rate limiter and
+# retries rate limit errors, timeouts, connection and server errors with jittered exponential backoff
+# (a random delay up to base_delay * 2^attempt, or the Retry-After of the provider).
+# async_create is the same for the async games: it awaits the AsyncOpenAI client made by `async_client_factory`
+# in the running event loop on the first call
+class LlmGateway:
+    RETRY_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+    def __init__(self, client: Any, limiter: Optional[TokenBucketLimiter] = None, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 async_client_factory: Optional[Callable[[], Any]] = None):
+        self.client = client
+        self.async_client = None
+        self.__async_client_factory = async_client_factory
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.rate_limit_wait = 0.0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list[dict[str, str]], max_tokens: int, **kwargs) -> Any:
+        # about 4 characters per token for the prompt, the answer is counted at its maximum
+        tokens = sum(len(message["content"]) for message in messages) // 4 + max_tokens
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.rate_limit_wait += self.limiter.acquire(tokens)
+            try:
+                response = self.client.chat.completions.create(model=model, messages=messages,
+                                                               max_tokens=max_tokens, **kwargs)
+            except LlmGateway.RETRY_ERRORS as e:
+                time.sleep(self.__retry(e, tokens, attempt))
+                attempt += 1
+                continue
+            if self.limiter and response.usage is not None:
+                self.limiter.settle(tokens, response.usage.total_tokens)
+            return response
+
+    async def async_create(self, model: str, messages: list[dict[str, str]], max_tokens: int, **kwargs) -> Any:
+        if self.async_client is None:
+            if self.__async_client_factory is None:
+                raise Exception("LlmGateway has no async client")
+            self.async_client = self.__async_client_factory()
+        tokens = sum(len(message["content"]) for message in messages) // 4 + max_tokens
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.rate_limit_wait += await self.limiter.async_acquire(tokens)
+            try:
+                response = await self.async_client.chat.completions.create(model=model, messages=messages,
+                                                                           max_tokens=max_tokens, **kwargs)
+            except LlmGateway.RETRY_ERRORS as e:
+                await asyncio.sleep(self.__retry(e, tokens, attempt))
+                attempt += 1
+                continue
+            if self.limiter and response.usage is not None:
+                self.limiter.settle(tokens, response.usage.total_tokens)
+            return response
+
+    # The delay before the next attempt after a failed call, raises the error when the attempts are over
+    def __retry(self, error: Exception, tokens: int, attempt: int) -> float:
+        if self.limiter:
+            # the provider counts the rejected request but not its tokens
+            self.limiter.settle(tokens, 0)
+        if attempt >= self.max_retries:
+            raise error
+        delay = self.__get_delay(error, attempt)
+        print(f"LLM call failed ({type(error).__name__}), retry {attempt + 1}/{self.max_retries} "
+              f"in {delay:.1f}s")
+        self.retries += 1
+        return delay
+
+    def __get_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay) + random.uniform(0, self.base_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def get_metrics(self) -> dict[str, float]:
+        return {"llm_retries": self.retries, "llm_rate_limit_wait_s": self.rate_limit_wait}
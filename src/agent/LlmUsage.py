@@ -0,0 +1,119 @@
+from typing import Any, Optional
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "prompt_chars", "latency_s", "cost_usd")
+LLM_USAGE_NAME = "llm_usage.json"
+LLM_CALLS_NAME = "llm_calls.json"
+
+
+# Prompt, completion and cached prefix tokens of an answer. DeepSeek reports the prefix cache hits as
+# prompt_cache_hit_tokens, OpenAI as prompt_tokens_details.cached_tokens.
+# Answers from the LLM cache or a replayed run have no usage and cost nothing
+def get_response_usage(response: Any) -> dict[str, int]:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    cached_tokens = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached_tokens is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None)
+    return {"prompt_tokens": usage.prompt_tokens or 0, "completion_tokens": usage.completion_tokens or 0,
+            "cached_tokens": cached_tokens or 0}
+
+
+# Tokens of chat messages estimated from their length. chars_per_token is calibrated on real runs as
+# prompt_chars / prompt_tokens of llm_usage.json (only answers of the API are counted there).
+# It doesn't change during a game, so replays and cached runs trim the context like the recorded run
+class TokenEstimator:
+    MESSAGE_TOKENS = 4  # role and separators of a chat message
+
+    def __init__(self, chars_per_token: float = 4.0):
+        self.chars_per_token = chars_per_token
+
+    def count(self, messages: list[dict[str, str]]) -> int:
+        return sum(int(len(message["content"]) / self.chars_per_token) + TokenEstimator.MESSAGE_TOKENS
+                   for message in messages)
+
+
+# The newest messages that fit into max_tokens, the older ones are dropped
+def get_last_messages(messages: list[dict[str, str]], max_tokens: int,
+                      estimator: TokenEstimator) -> list[dict[str, str]]:
+    tokens = 0
+    for start in range(len(messages) - 1, -1, -1):
+        tokens += estimator.count([messages[start]])
+        if tokens > max_tokens:
+            return messages[start + 1:]
+    return messages
+
+
+def empty_usage() -> dict[str, float]:
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+def add_usage(total: dict[str, float], usage: dict[str, float]):
+    for field in USAGE_FIELDS:
+        total[field] = total.get(field, 0) + usage.get(field, 0)
+
+
+# Tokens, latency and cost of the LLM calls of an agent in total, per stage (the sub-agent of
+# the multi agents: log_analyzer, role_finder, cooperator, player, summarizer...) and per decision
+# (the agent method the emulator asked, the keys of agents_map). Prices are USD per million tokens
+class LlmUsage:
+    def __init__(self, prices: Optional[dict[str, float]] = None):
+        self.prices = prices or {}
+        self.total = empty_usage()
+        self.stages = {}
+        self.decisions = {}
+
+    def add(self, stage: str, decision: Optional[str], usage: dict[str, int], latency: float) -> dict[str, float]:
+        call = {"calls": 1, **usage, "latency_s": latency, "cost_usd": self.get_cost(usage)}
+        add_usage(self.total, call)
+        add_usage(self.stages.setdefault(stage, empty_usage()), call)
+        add_usage(self.decisions.setdefault(decision or "unknown", empty_usage()), call)
+        return call
+
+    def get_cost(self, usage: dict[str, int]) -> float:
+        uncached_tokens = usage["prompt_tokens"] - usage["cached_tokens"]
+        return (uncached_tokens * self.prices.get("prompt", 0)
+                + usage["cached_tokens"] * self.prices.get("cached_prompt", self.prices.get("prompt", 0))
+                + usage["completion_tokens"] * self.prices.get("completion", 0)) / 1_000_000
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"total": self.total, "stages": self.stages, "decisions": self.decisions}
+
+    def restore(self, data: dict[str, Any]):
+        self.total = data["total"]
+        self.stages = data["stages"]
+        self.decisions = data["decisions"]
+
+    # Usage of the run: the sum over the agents and every agent on its own
+    @staticmethod
+    def merge(agents_usage: dict[str, dict[str, Any]]) -> dict[str, Any]:
+        run_usage = {"total": empty_usage(), "stages": {}, "decisions": {}, "agents": {}}
+        for name, usage in agents_usage.items():
+            add_usage(run_usage["total"], usage["total"])
+            for group in ("stages", "decisions"):
+                for key, value in usage[group].items():
+                    add_usage(run_usage[group].setdefault(key, empty_usage()), value)
+            run_usage["agents"][name] = usage
+        return run_usage
+
+    # Flat mlflow metrics: llm_<field> for the run, llm_<group>/<key>/<field> per stage, decision and agent
+    @staticmethod
+    def get_metrics(run_usage: dict[str, Any]) -> dict[str, float]:
+        metrics = {f"llm_{field}": value for field, value in run_usage["total"].items()}
+        groups = {"stage": run_usage["stages"], "decision": run_usage["decisions"],
+                  "agent": {name: usage["total"] for name, usage in run_usage["agents"].items()}}
+        for group, usages in groups.items():
+            for key, usage in usages.items():
+                for field, value in usage.items():
+                    metrics[f"llm_{group}/{key}/{field}"] = value
+        return metrics
+
+    @staticmethod
+    def format(run_usage: dict[str, Any]) -> str:
+        total = run_usage["total"]
+        return (f"{total['calls']} calls, {total['prompt_tokens']} prompt tokens ({total['cached_tokens']} cached), "
+                f"{total['completion_tokens']} completion tokens, {total['latency_s']:.1f}s, "
+                f"${total['cost_usd']:.4f}"
+                + (f", {total['prompt_chars'] / total['prompt_tokens']:.2f} chars per token"
+                   if total["prompt_tokens"] else ""))
@@ -0,0 +1,124 @@
+import re
+from collections import deque
+from types import SimpleNamespace
+from typing import Any
+
+from src.observ.RunArchive import read_run_jsonl
+
+SUMMARY_AGENT = "summary"
+# events in the prompts carry the wall clock time, headless games log them without it
+DTTM_FIELD_PATTERN = re.compile(r', "dttm": "[^"]*"')
+
+
+# Key of the request an answer was recorded for: the content of its last message without the event times
+def get_request_key(content: str) -> str:
+    return DTTM_FIELD_PATTERN.sub("", content)
+
+
+# Raw LLM answers of an agent in the order they were generated, each with the content of the last message
+# of its request: the prompt, or in the multi agent pipelines the answer of the previous sub-agent.
+# Multi agents mark every answer with the sub-agent name. Single LLM agents log prompt, answer,
+# [regenerate prompt, answer]... and then the accepted answer once more, the repeat is skipped.
+def get_recorded_answers(local_log: list[dict[str, Any]], agent: str = None) -> list[tuple[str, str]]:
+    if any("agent" in record for record in local_log):
+        answers = []
+        previous = None
+        for record in local_log:
+            if "error" in record:
+                continue
+            if "agent" in record and (record["agent"] == agent if agent is not None
+                                      else record["agent"] != SUMMARY_AGENT):
+                answers.append((previous, record["content"]))
+            previous = record["content"]
+        return answers
+    if agent is not None:
+        return []
+
+    answers = []
+    prompt = None
+    expect_answer = False
+    for record in local_log:
+        if "error" in record:
+            continue
+        if expect_answer:
+            answers.append((prompt, record["content"]))
+            expect_answer = False
+        elif answers and record["content"] == answers[-1][1]:
+            # the accepted answer, the next record is a prompt again
+            continue
+        else:
+            prompt = record["content"]
+            expect_answer = True
+    return answers
+
+
+# Stands in for the OpenAI client (client.chat.completions.create, async_create in async games) and returns
+# the answers recorded in agents/<name>/local_log.json of a finished run, so the agent code parses them
+# as if they came from the API. An answer is served only to the request it was recorded for
+# (the same last message), a request the recorded agent never made is an error: the replayed game
+# went another way, e.g. a decision recorded in an old run is made automatically now.
+# With in_order (llm_replay_legacy) the answers are served in the recorded order whatever the request,
+# for runs recorded before the automatic decisions; only running out of answers is an error then,
+# a request that differs from the recorded one is counted and the first one is reported.
+# The first error is raised again on every later request, so it isn't lost when the emulator
+# logs it as a step error and goes on.
+# `agent` picks the answers of one sub-agent (e.g. the SumCoopMultiLlmAgent summaries),
+# runs logged before it was recorded get empty answers.
+class ReplayClient:
+    def __init__(self, run_path: str, agent_name: str, agent: str = None, in_order: bool = False):
+        self.run_path = run_path
+        self.agent_name = agent_name
+        self.in_order = in_order
+        local_log = read_run_jsonl(run_path, f"agents/{agent_name}/local_log.json")
+        recorded_answers = get_recorded_answers(local_log, agent)
+        if in_order:
+            self.__answers = deque((get_request_key(content or ""), answer) for content, answer in recorded_answers)
+        else:
+            self.__answers = {}
+            for content, answer in recorded_answers:
+                self.__answers.setdefault(get_request_key(content or ""), deque()).append(answer)
+        self.__size = len(recorded_answers)
+        self.__missing_ok = agent is not None and not recorded_answers
+        self.__error = None
+        self.position = 0
+        self.mismatches = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list[dict[str, str]], **kwargs) -> SimpleNamespace:
+        if self.__error is not None:
+            raise Exception(self.__error)
+        if self.__missing_ok:
+            answer = ""
+        else:
+            content = messages[-1]["content"] if messages else ""
+            key = get_request_key(content)
+            answers = self.__answers if self.in_order else self.__answers.get(key)
+            if not answers:
+                if self.in_order:
+                    self.__error = (f"{self.agent_name} made more requests than the {self.__size} recorded "
+                                    f"in {self.run_path}, the replayed game went another way")
+                else:
+                    self.__error = (f"Request {self.position + 1} of {self.agent_name} matches no recorded request "
+                                    f"in {self.run_path}, the replayed game went another way. "
+                                    f"Last message of the request:\n{content[:500]}")
+                raise Exception(self.__error)
+            answer = answers.popleft()
+            if self.in_order:
+                recorded_key, answer = answer
+                if recorded_key != key:
+                    self.mismatches += 1
+                    if self.mismatches == 1:
+                        print(f"Request {self.position + 1} of {self.agent_name} differs from the recorded one, "
+                              f"the replayed game may have gone another way")
+            self.position += 1
+        return SimpleNamespace(model=model, usage=None,
+                               choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=answer))])
+
+    async def async_create(self, model: str, messages: list[dict[str, str]], **kwargs) -> SimpleNamespace:
+        return self.create(model, messages, **kwargs)
+
+    def get_metrics(self) -> dict[str, int]:
+        metrics = {"llm_replayed_answers": self.position}
+        if self.in_order:
+            metrics["llm_replay_mismatches"] = self.mismatches
+        return metrics
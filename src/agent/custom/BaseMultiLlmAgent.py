@@ -1,11 +1,13 @@
 import json
 import pprint
-from typing import Any, Union
+import time
+from typing import Any, Generator, Union
 import re
 
 from rich.console import Console
 
-from src.agent.Agent import Agent, init_agent
+from src.agent.Agent import LlmAgent, init_llm_client
+from src.agent.LlmUsage import TokenEstimator, get_last_messages
 from src.agent.custom.BaseMultiLlmAgentPrompts import BaseMultiLlmAgentPrompts
 from src.emulator.Emulator import LogEventType
 from src.emulator.LoggedList import LoggedList
@@ -14,14 +16,14 @@ from src.game.Game import Game
 from src.game.Player import Player
 
 
-class BaseMultiLlmAgent(Agent):
+class BaseMultiLlmAgent(LlmAgent):
     def __init__(self, agent_name: str,
                  config: dict[str, Any],
                  player: Player,
                  game: Game,
                  shared_memory: LoggedList):
         self.console = Console(force_terminal=True)
-        self.client = init_agent()
+        self.client = init_llm_client(config, agent_name)
         self.prompts = BaseMultiLlmAgentPrompts()
         self.chat_context = []
         self.agents = {"player": {"system_prompt": self.prompts.player_prompt},
@@ -32,21 +34,24 @@ class BaseMultiLlmAgent(Agent):
         super().__init__(agent_name, config, player, game, shared_memory)
         self.agents_map = self.agent_config['agents_map']
         self.MAX_CONTEXT_LEN = self.agent_config["context_len"]
+        # token budget of the chat history (without the system prompt), context_len is used without it
+        self.max_context_tokens = self.agent_config.get("context_tokens")
+        self.token_estimator = TokenEstimator(self.agent_config.get("chars_per_token", 4.0))
         self.base_gen_conf = self.agent_config["base_gen_conf"]
 
     @staticmethod
     def base_agents_list() -> list:
         return ["summarizer"]
 
-    def ask_llm(self, prompt: str, agents: list, so_answer_field_name: Union[str, None] = "result") -> str:
+    def ask_llm(self, prompt: str, agents: list, so_answer_field_name: Union[str, None] = "result") -> Generator[dict[str, Any], Any, str]:
         if not agents:
             agents = self.base_agents_list()
-        answer, json_objects, errors = self.generate_answer(prompt, agents=agents)
+        answer, json_objects, errors = yield from self.generate_answer(prompt, agents=agents)
         while (errors
                or (not json_objects and so_answer_field_name)
                or (json_objects and so_answer_field_name and not json_objects[0].get(so_answer_field_name))):
             prompt = {"prompt": self.prompts.get_regenerate_prompt(so_answer_field_name, errors)}
-            answer, json_objects, errors = self.generate_answer(prompt, regenerate=True)
+            answer, json_objects, errors = yield from self.generate_answer(prompt, regenerate=True)
 
         json_object = json_objects[0]
         users_role = json_object.get("users_role")
@@ -98,7 +103,7 @@ class BaseMultiLlmAgent(Agent):
                 system_prompt = [{"role": "system", "content": self.agents[agent]['system_prompt']}]
                 all_context = system_prompt + self.chat_context + task_context
 
-            answer = self.llm_api_call(all_context, self.base_gen_conf)
+            answer = yield from self.llm_api_call(all_context, self.base_gen_conf, stage=agent)
 
             print("===" * 30)
             print(f"Agent name: {agent}")
@@ -114,24 +119,49 @@ class BaseMultiLlmAgent(Agent):
         json_objects, errors = self.extract_json_objects(row_text=answer)
         return answer, json_objects, errors
 
-    def llm_api_call(self, messages, gen_config: dict[str, Any]) -> str:
-        response = self.client.chat.completions.create(
+    def llm_api_call(self, messages, gen_config: dict[str, Any], client=None, stage: str = "player") -> Generator[dict[str, Any], Any, str]:
+        client = client or self.client
+        start = time.perf_counter()
+        response = yield from self._llm_request(
+            client,
             model=gen_config["model"],
             messages=messages,
             temperature=gen_config["temperature"],
             max_tokens=gen_config["max_tokens"],
             stream=False
         )
+        self._record_llm_call(stage, gen_config["model"], messages, response, time.perf_counter() - start)
 
         return response.choices[0].message.content
 
     def trim_chat_context(self):
-        if len(self.chat_context) > self.MAX_CONTEXT_LEN:
+        if self.max_context_tokens:
+            trimmed = get_last_messages(self.chat_context, self.max_context_tokens, self.token_estimator)
+            if len(trimmed) < len(self.chat_context):
+                print("===" * 30)
+                print(f"Trim chat context to {self.max_context_tokens} tokens: "
+                      f"{len(self.chat_context) - len(trimmed)} oldest messages dropped")
+                print("===" * 30)
+                self.chat_context = trimmed
+        elif len(self.chat_context) > self.MAX_CONTEXT_LEN:
             print("===" * 30)
             print("Trim chat context")
             print("===" * 30)
             self.chat_context = self.chat_context[-self.MAX_CONTEXT_LEN:]
 
+    def get_metrics(self) -> dict[str, float]:
+        metrics = super().get_metrics()
+        metrics.update(self.client.get_metrics())
+        return metrics
+
+    def get_checkpoint(self) -> dict[str, Any]:
+        checkpoint = super().get_checkpoint()
+        checkpoint["chat_context"] = self.chat_context
+        return checkpoint
+
+    def restore_checkpoint(self, checkpoint: dict[str, Any]):
+        super().restore_checkpoint(checkpoint)
+        self.chat_context = checkpoint["chat_context"]
 
     def extract_json_objects(self, row_text: str):
         errors = []
@@ -159,67 +189,66 @@ class BaseMultiLlmAgent(Agent):
             discarded.append(self.player_hand[i].card_id.value)
         return " ".join(discarded)
 
-    def choice_card_for_play(self) -> str:
+    def choice_card_for_play_steps(self) -> Generator[dict[str, Any], Any, str]:
         self._errors = 0
         game_state = self.get_game_state()
         prompt = self.prompts.choice_card_for_play_prompt(game_state=game_state)
         agents = self.agents_map.get('choice_card_for_play', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_opponent(self, card: Card) -> str:
-        opponents = [player for player in self.game.get_player_names() if player != self.name]
+    def get_opponent_steps(self, card: Card, opponents: list[str]) -> Generator[dict[str, Any], Any, str]:
         game_state = {"card": card, "opponents": opponents}
         prompt = self.prompts.get_opponent_prompt(game_state=game_state)
         agents = self.agents_map.get('get_opponent', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_action_type(self, card: Card, options: dict) -> str:
+    def get_action_type_steps(self, card: Card, options: dict) -> Generator[dict[str, Any], Any, str]:
         opponent = options["opponent"]
         game_state = {"card": card, "opponent": opponent}
         prompt = self.prompts.get_action_type_prompt(game_state=game_state)
         agents = self.agents_map.get('get_action_type', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_card_for_steal(self, card: Card, options: dict) -> str:
+    def get_card_for_steal_steps(self, card: Card, options: dict) -> Generator[dict[str, Any], Any, str]:
         opponent = options["opponent"]
         action_type = options["action_type"]
         game_state = {"card": card, "opponent": opponent, "action_type": action_type}
         prompt = self.prompts.get_card_for_steal_prompt(game_state=game_state)
         agents = self.agents_map.get('get_card_for_steal', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_indians_response(self) -> str:
+    def get_indians_response_steps(self) -> Generator[dict[str, Any], Any, str]:
         game_state = self.get_game_state()
         prompt = self.prompts.get_indians_response_prompt(game_state=game_state)
         agents = self.agents_map.get('get_indians_response', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_bang_response(self) -> str:
+    def get_bang_response_steps(self) -> Generator[dict[str, Any], Any, str]:
         game_state = self.get_game_state()
         prompt = self.prompts.get_bang_response_prompt(game_state=game_state)
         agents = self.agents_map.get('get_bang_response', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_gatling_response(self) -> str:
+    def get_gatling_response_steps(self) -> Generator[dict[str, Any], Any, str]:
         game_state = self.get_game_state()
         prompt = self.prompts.get_gatling_response_prompt(game_state=game_state)
         agents = self.agents_map.get('get_gatling_response', [])
-        return self.ask_llm(prompt, agents=agents)
+        return (yield from self.ask_llm(prompt, agents=agents))
 
-    def get_card_for_discard(self, num_cards: int) -> str:
+    def get_card_for_discard_steps(self, num_cards: int) -> Generator[dict[str, Any], Any, str]:
         if self._errors < 3:
             game_state = {"num_cards": num_cards, "cur_state": self.get_player_current_state()}
             prompt = self.prompts.get_card_for_discard_prompt(game_state=game_state)
             agents = self.agents_map.get('get_card_for_discard', [])
-            return self.ask_llm(prompt, agents=agents)
+            return (yield from self.ask_llm(prompt, agents=agents))
         else:
             return self.base_card_for_discard(num_cards)
 
-    def react_to_discard_error(self, errors: str):
+    def react_to_discard_error_steps(self, errors: str) -> Generator[dict[str, Any], Any, None]:
         game_state = {"errors": errors, "cur_state": self.get_player_current_state()}
         prompt = self.prompts.react_to_discard_error_prompt(game_state=game_state)
         agents = self.agents_map.get('react_to_discard_error', [])
-        self.ask_llm(prompt, agents=agents, so_answer_field_name=None)
+        yield from self.ask_llm(prompt, agents=agents, so_answer_field_name=None)
         self.console.print(f"[red]ERROR:[/red] ERROR ON DISCARD", style="bold")
         self._errors += 1
 
@@ -1,6 +1,6 @@
 import pprint
 import re
-from typing import Any, Union
+from typing import Any, Generator, Union
 
 from src.agent.custom.BaseMultiLlmAgent import BaseMultiLlmAgent
 from src.agent.custom.CoopMultiLlmAgentV2Prompts import CoopMultiLlmAgentV2Prompts
@@ -25,16 +25,16 @@ class CoopMultiLlmAgentV2(BaseMultiLlmAgent):
                        "summarizer": {"system_prompt": self.prompts.summarizer_prompt}, }
         self.coop_agent_answer = ""
 
-    def ask_llm(self, prompt: str, agents: list, so_answer_field_name: Union[str, None] = "result") -> str:
+    def ask_llm(self, prompt: str, agents: list, so_answer_field_name: Union[str, None] = "result") -> Generator[dict[str, Any], Any, str]:
         if not agents:
             agents = self.base_agents_list()
         self.coop_agent_answer = ""
-        answer, json_objects, errors = self.generate_answer(prompt, agents=agents)
+        answer, json_objects, errors = yield from self.generate_answer(prompt, agents=agents)
         while (errors
                or (not json_objects and so_answer_field_name)
                or (json_objects and so_answer_field_name and not json_objects[0].get(so_answer_field_name))):
             prompt = {"prompt": self.prompts.get_regenerate_prompt(so_answer_field_name, errors)}
-            answer, json_objects, errors = self.generate_answer(prompt, regenerate=True)
+            answer, json_objects, errors = yield from self.generate_answer(prompt, regenerate=True)
 
         json_object = json_objects[0]
         users_role = json_object.get("users_role")
@@ -89,7 +89,7 @@ class CoopMultiLlmAgentV2(BaseMultiLlmAgent):
                 system_prompt = [{"role": "system", "content": self.agents[agent]['system_prompt']}]
                 all_context = system_prompt + self.chat_context + task_context
 
-            answer = self.llm_api_call(all_context, self.base_gen_conf)
+            answer = yield from self.llm_api_call(all_context, self.base_gen_conf, stage=agent)
 
             print("===" * 30)
             print(f"Agent name: {agent}")
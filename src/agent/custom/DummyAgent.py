@@ -2,6 +2,7 @@ import random
 from typing import Any
 
 from src.agent.Agent import Agent
+from src.emulator.Emulator import LogEventType
 from src.emulator.LoggedList import LoggedList
 from src.game.Card import Card
 from src.game.Game import Game
@@ -15,14 +16,40 @@ class DummyAgent(Agent):
                  game: Game,
                  shared_memory: LoggedList):
         super().__init__(agent_name, config, player, game, shared_memory)
+        self.__last_choice_index = len(shared_memory)
+        self.rng = random.Random(f"{game.seed}:{agent_name}")
+
+    def get_checkpoint(self) -> dict[str, Any]:
+        checkpoint = super().get_checkpoint()
+        checkpoint["last_choice_index"] = self.__last_choice_index
+        checkpoint["random_state"] = self.rng.getstate()
+        return checkpoint
+
+    def restore_checkpoint(self, checkpoint: dict[str, Any]):
+        super().restore_checkpoint(checkpoint)
+        self.__last_choice_index = checkpoint["last_choice_index"]
+        self.rng.setstate(checkpoint["random_state"])
+
+    def __has_error_this_turn(self) -> bool:
+        last_events = self.shared_memory[self.__last_choice_index:]
+        self.__last_choice_index = len(self.shared_memory)
+        for event in reversed(last_events):
+            if event["type"] == LogEventType.TURN_PLAYER:
+                return False
+            if event["type"] in (LogEventType.STEP_ERROR, LogEventType.DRAFT_PLAY_CARD_FAIL):
+                return True
+        return False
 
     def choice_card_for_play(self) -> str:
-        if self.player.get_state_log()["cur_hp"] >= len(self.player_hand):
+        # the dummy agent doesn't learn from errors, so it ends the turn instead of retrying forever
+        if self.__has_error_this_turn():
+            return "end"
+        if self.player.get_health() >= len(self.player_hand):
             return "end"
         else:
             player_card_ids = [card.card_id.value for card in self.player_hand]
             for i in range(2):
-                card_id = random.choice(player_card_ids)
+                card_id = self.rng.choice(player_card_ids)
                 if card_id == "miss":
                     continue
                 if card_id == "bang":
@@ -33,23 +60,18 @@ class DummyAgent(Agent):
 
             return "end"
 
-    def get_opponent(self, card: Card) -> str:
-        all_players = self.game.get_player_names()
-        my_name = self.player.name
-        my_index = all_players.index(my_name)
-        if my_index == len(all_players) - 1:
-            options = [all_players[my_index - 1], all_players[0]]
-        elif my_index == 0:
-            options = [all_players[-1], all_players[1]]
-        else:
-            options = [all_players[my_index - 1], all_players[my_index + 1]]
-        return random.choice(options)
+    def get_opponent(self, card: Card, opponents: list[str]) -> str:
+        return self.rng.choice(opponents)
 
     def get_action_type(self, card: Card, options: dict) -> str:
         return "from_hand"
 
     def get_card_for_steal(self, card: Card, options: dict) -> str:
-        return input(f"Enter the name of the card: ").strip().lower()
+        opponent = self.game.get_player(options["opponent"])
+        cards = opponent.get_effects().copy()
+        if isinstance(opponent.get_weapon(), Card):
+            cards.append(opponent.get_weapon())
+        return self.rng.choice(cards).card_id.value
 
     def get_indians_response(self) -> str:
         return "bang"
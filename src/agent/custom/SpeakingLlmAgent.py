@@ -1,5 +1,5 @@
 import pprint
-from typing import Any, Union
+from typing import Any, Generator, Union
 
 from src.agent.custom.SpeakingLlmAgentPrompts import SpeakingLlmAgentPrompts
 from src.agent.custom.BaseLlmAgent import BaseLlmAgent
@@ -22,15 +22,15 @@ class SpeakingLlmAgent(BaseLlmAgent):
             {"role": "system", "content": self.system_prompt}
         ]
 
-    def ask_llm(self, prompt: dict[str, str], so_answer_field_name: Union[str, None] = "result") -> str:
+    def ask_llm(self, prompt: dict[str, str], so_answer_field_name: Union[str, None] = "result") -> Generator[dict[str, Any], Any, str]:
         self.trim_chat_context()
-        answer, json_objects, errors = self.generate_answer(prompt)
+        answer, json_objects, errors = yield from self.generate_answer(prompt)
         while (errors
             or (not json_objects and so_answer_field_name)
             or (json_objects and so_answer_field_name and not json_objects[0].get(so_answer_field_name))):
 
             prompt = {"prompt": self.prompts.get_regenerate_prompt(so_answer_field_name, errors)}
-            answer, json_objects, errors = self.generate_answer(prompt)
+            answer, json_objects, errors = yield from self.generate_answer(prompt)
 
         json_object = json_objects[0]
         users_role = json_object.get("users_role")
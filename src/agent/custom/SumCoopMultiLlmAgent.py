@@ -4,7 +4,8 @@ import re
 
 from openai import OpenAI
 
-from src.agent.Agent import Agent
+from src.agent.Agent import Agent, init_llm_client
+from src.agent.ReplayClient import SUMMARY_AGENT
 from src.agent.custom.CoopMultiLlmAgentV2 import CoopMultiLlmAgentV2
 from src.agent.custom.SumCoopMultiLlmAgentPrompt import SumCoopMultiLlmAgentPrompts
 from src.emulator.Emulator import LogEventType
@@ -30,6 +31,9 @@ class SumCoopMultiLlmAgent(CoopMultiLlmAgentV2):
                        "cooperator": {"system_prompt": self.prompts.cooperator_prompt},
                        "summarizer": {"system_prompt": self.prompts.summarizer_prompt}, }
         self.summary_gen_conf =  self.agent_config["summary_gen_conf"]
+        # summaries are logged as answers of their own sub-agent, an offline replay serves them separately
+        self.summary_client = init_llm_client(config, agent_name, SUMMARY_AGENT) \
+            if config.get("llm_replay_run") else self.client
 
     def generate_answer(self, prompt: dict[str, str], agents: Union[list, None] = None, regenerate: bool = False):
         task_context = []
@@ -62,7 +66,7 @@ class SumCoopMultiLlmAgent(CoopMultiLlmAgentV2):
                 system_prompt = [{"role": "system", "content": self.agents[agent]['system_prompt']}]
                 all_context = system_prompt + self.chat_context + task_context
 
-            answer = self.llm_api_call(all_context, self.base_gen_conf)
+            answer = yield from self.llm_api_call(all_context, self.base_gen_conf, stage=agent)
 
             print("===" * 30)
             print(f"Agent name: {agent}")
@@ -89,12 +93,14 @@ class SumCoopMultiLlmAgent(CoopMultiLlmAgentV2):
             system_prompt = [{"role": "system", "content": self.prompts.task_summarize_prompt}]
             all_context = system_prompt + self.chat_context + task_context
 
-            summarization = self.llm_api_call(all_context, self.summary_gen_conf)
+            summarization = yield from self.llm_api_call(all_context, self.summary_gen_conf, self.summary_client,
+                                                         SUMMARY_AGENT)
         
             print("===" * 30)
             print(f"Summarization")
             print("Raw answer: ")
             print(summarization)
+            self.local_log.append({"content": summarization, "agent": SUMMARY_AGENT})
             self.chat_context.append({"role": "assistant", "content": summarization})
         else:
             self.chat_context.extend(task_context)
@@ -18,8 +18,8 @@ class UserAgent(Agent):
     def choice_card_for_play(self) -> str:
         return input(f"Enter the name of a card to play or end to end a turn: ").strip()
 
-    def get_opponent(self, card: Card) -> str:
-        return input(f"Enter your opponent's name: ").strip().lower()
+    def get_opponent(self, card: Card, opponents: list[str]) -> str:
+        return input(f"Enter your opponent's name ({', '.join(opponents)}): ").strip().lower()
 
     def get_action_type(self, card: Card, options: dict) -> str:
         return input(f"Enter where the card should be from (from_hand, from_play): ").strip().lower()
@@ -0,0 +1,46 @@
+import os
+import pickle
+from typing import Any
+
+from src.observ.RunArchive import JSONL_FILES
+
+CHECKPOINT_NAME = "checkpoint.pkl"
+
+
+# The checkpoint is written to a temporary file and moved over the old one,
+# so a crash while saving leaves the previous checkpoint intact
+def save_checkpoint(run_path: str, checkpoint: dict[str, Any]):
+    path = os.path.join(run_path, CHECKPOINT_NAME)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(run_path: str) -> dict[str, Any]:
+    path = os.path.join(run_path, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        raise Exception(f"No checkpoint to resume from in {run_path}")
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def remove_checkpoint(run_path: str):
+    path = os.path.join(run_path, CHECKPOINT_NAME)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Cuts the JSONL logs of the run back to their size at the checkpoint,
+# events written after it will be written again by the resumed game
+def truncate_logs(run_path: str, log_offsets: dict[str, int]):
+    for root, _, files in os.walk(run_path):
+        for file_name in files:
+            if file_name not in JSONL_FILES:
+                continue
+            path = os.path.join(root, file_name)
+            name = os.path.relpath(path, run_path).replace(os.sep, "/")
+            offset = log_offsets.get(name, 0)
+            if os.path.getsize(path) > offset:
+                os.truncate(path, offset)
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import importlib
 import json
@@ -6,24 +7,29 @@ import pkgutil
 from collections import defaultdict
 from enum import Enum
 from pprint import pprint
-from typing import Any, Optional, Callable, Union
-from zoneinfo import ZoneInfo
+from typing import Any, Optional, Callable, Union, Generator
 
 from inflection import underscore, camelize
+from omegaconf import DictConfig, OmegaConf
 
 from src.agent.Agent import Agent
+from src.agent.LlmUsage import LlmUsage, LLM_USAGE_NAME
 from src.agent.custom.UserAgent import UserAgent
 import src.agent.custom as agent_module
+from src.emulator.Checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint, truncate_logs
 from src.emulator.LoggedList import LoggedList, SavePath
-from src.game.Card import Card, CardID, CardActionRequest
-from src.game.Config import Config
+from src.game.Card import Card, CardID, CardActionRequest, BANG, MISS
+from src.game.Config import Config, ResolvedConfig
 from src.game.Game import Game, GameResult
 from src.game.Player import Player, PlayerActionResponse
-from src.game.Utils import GameEncoder
 from src.observ.GameExperimentLogger import GameExperimentLogger
+from src.observ.JsonlWriter import JsonlWriter, LOG_TIMEZONE
+from src.observ.RunArchive import pack_run
+from src.observ.StateDelta import StateDeltaEncoder
 
 
 class LogEventType(Enum):
+    PLAYERS_GAME_STATE_DELTA = 12
     PLAYER_SAY = 11
     NEED_DISCARD_CARDS = 10
     STEP_ERROR = 9
@@ -39,31 +45,129 @@ class LogEventType(Enum):
 
 
 class GameEmulator:
+    __agent_classes = None
 
-    def __init__(self, config_path: str,
+    def __init__(self, config: Union[str, DictConfig, ResolvedConfig],
                  current_player_state_render: Optional[Callable[[Player], None]] = None,
                  players_game_state_render: Optional[Callable[[dict[str, Any]], None]] = None,
-                 use_gui: bool = False):
-        self.__config = Config()
-        self.__config.init(config_path)
-        self.__exp_logger = GameExperimentLogger()
-        self.__exp_logger.start_run()
-        self.use_gui = use_gui
-        Config().config.gui = self.use_gui
-        self.__game = Game(current_player_state_render, players_game_state_render)
-        self.__shared_memory = LoggedList(self._write_json_log, SavePath.SHARED_MEMORY)
-        self.__agents = self.__init_agents(self.__game, self.__shared_memory, config=Config().config)
+                 use_gui: bool = False,
+                 headless: bool = False,
+                 seed: Optional[int] = None,
+                 run_index: Optional[int] = None,
+                 checkpoint: Optional[dict[str, Any]] = None):
+        self.__config = Config(config)
+        self.headless = headless
+        # shared by the games of a headless batch, its flags are set once in ResolvedConfig.create
+        if isinstance(self.__config.config, ResolvedConfig) and (not headless or checkpoint is not None):
+            raise Exception("ResolvedConfig is only for new headless games")
+        self.__exp_logger = None
+        if not self.headless and checkpoint is None:
+            self.__exp_logger = GameExperimentLogger(self.__config.config, run_index)
+            self.__exp_logger.start_run()
+        elif not self.headless:
+            self.__exp_logger = GameExperimentLogger(self.__config.config, run_index, checkpoint["mlflow_run_id"])
+            self.__exp_logger.resume_run()
+        self.use_gui = use_gui and not self.headless
+        if not isinstance(self.__config.config, ResolvedConfig):
+            self.__config.config.gui = self.use_gui
+            self.__config.config.headless = self.headless
+            self.__config.config.resume = checkpoint is not None
+        if seed is None and self.__exp_logger:
+            seed = self.__exp_logger.run_seed
+        self.__game = Game(self.__config.config, current_player_state_render, players_game_state_render, seed=seed)
+        self.__log_writers = {}
+        # full game state every state_keyframe_interval logged states, deltas in between
+        keyframe_interval = self.__config.config.get("state_keyframe_interval", 20)
+        self.__game_state_encoder = StateDeltaEncoder(keyframe_interval)
+        self.__players_game_state_encoder = StateDeltaEncoder(keyframe_interval)
+        self.__shared_memory = LoggedList(self.__write_shared_memory_log, SavePath.SHARED_MEMORY, gui=self.use_gui)
+        self.__agents = self.__init_agents(self.__game, self.__shared_memory, config=self.__config.config)
+        self.actions_count = 0
+        # decisions with a single legal answer, made without calling the agent
+        self.auto_decisions = defaultdict(int)
+        # replay of a run recorded before the legal move checks: every decision goes to the agent as then
+        self.__legacy_decisions = self.__config.config.get("llm_replay_legacy", False)
+        # a forked game starts in the middle of a turn
+        self.__turn_started = False
+        if checkpoint is not None:
+            self.__restore_checkpoint(checkpoint)
+
+    # Continues the game in run_path from the last turn it started
+    @staticmethod
+    def from_checkpoint(run_path: str, **kwargs) -> "GameEmulator":
+        checkpoint = load_checkpoint(run_path)
+        config = OmegaConf.create(checkpoint["config"])
+        config.save_path = run_path
+        return GameEmulator(config, seed=checkpoint["seed"], run_index=checkpoint["run_index"],
+                            checkpoint=checkpoint, **kwargs)
+
+    # Saved at every turn boundary: engine state, agents, shared memory and the size of every log,
+    # so the resumed game gets the same random streams and rewrites only the events after the checkpoint
+    def save_checkpoint(self):
+        if self.headless or not self.__config.config.get("checkpoint", False):
+            return
+        save_path = self.__config.config.save_path
+        log_offsets = {writer.path: writer.tell() for writer in self.__log_writers.values()}
+        for agent in self.__agents.values():
+            log_offsets.update(agent.get_log_offsets())
+        save_checkpoint(save_path, {
+            "config": OmegaConf.to_container(self.__config.config, resolve=True),
+            "seed": self.__game.seed,
+            "run_index": self.__exp_logger.run_index,
+            "mlflow_run_id": self.__exp_logger.run_id,
+            "game": self.__game.snapshot(),
+            "shared_memory": list(self.__shared_memory),
+            "agents": {name: agent.get_checkpoint() for name, agent in self.__agents.items()},
+            "log_offsets": {os.path.relpath(path, save_path).replace(os.sep, "/"): offset
+                            for path, offset in log_offsets.items()},
+            "actions_count": self.actions_count,
+            "auto_decisions": dict(self.auto_decisions),
+        })
+
+    # Takes over a game replayed up to some step (src/emulator/Replay.py) with this emulator's agents.
+    # The log of the source run up to that step is copied, so the fork can be replayed and analyzed as usual
+    def continue_from(self, fork: dict[str, Any]):
+        self.__game.restore(fork["game"])
+        self.__shared_memory[:] = fork["shared_memory"]
+        self.actions_count = fork["step"]
+        self.__turn_started = True
+        if self.headless:
+            return
+        save_path = self.__config.config.save_path
+        for file_name in ("game_log.json", SavePath.SHARED_MEMORY.value):
+            with open(os.path.join(save_path, file_name), "a", encoding="utf-8") as f:
+                for event in fork[file_name]:
+                    f.write(json.dumps(event) + "\n")
+        with open(os.path.join(save_path, "fork.json"), "w", encoding="utf-8") as f:
+            json.dump({"source_run": fork["source_run"], "step": fork["step"]}, f, indent=4)
+
+    def __restore_checkpoint(self, checkpoint: dict[str, Any]):
+        truncate_logs(self.__config.config.save_path, checkpoint["log_offsets"])
+        self.__game.restore(checkpoint["game"])
+        # slice assignment fills the list without writing the events to the log again
+        self.__shared_memory[:] = checkpoint["shared_memory"]
+        for name, agent in self.__agents.items():
+            agent.restore_checkpoint(checkpoint["agents"][name])
+        self.actions_count = checkpoint["actions_count"]
+        self.auto_decisions.update(checkpoint["auto_decisions"])
 
     @property
     def shared_memory(self):
         return self.__shared_memory
 
+    @property
+    def game(self):
+        return self.__game
+
     @property
     def current_agent(self):
         return self.__agents[self.__game.current_player_state.name]
 
     @staticmethod
     def get_all_loaded_agent_classes() -> dict[str, Any]:
+        if GameEmulator.__agent_classes is not None:
+            return GameEmulator.__agent_classes
+
         classes = {}
         for _, module_name, _ in pkgutil.iter_modules(agent_module.__path__):
             module = importlib.import_module(f'src.agent.custom.{module_name}')
@@ -72,6 +176,7 @@ class GameEmulator:
                 classes[module_name] = module
 
         print("Find agent classes:", classes.keys())
+        GameEmulator.__agent_classes = classes
         return classes
 
     @staticmethod
@@ -93,14 +198,18 @@ class GameEmulator:
         _ = self.__game.current_player_state
 
     def start_of_turn(self):
+        # the state logged at the start of the turn is the one before the draw, headless games too:
+        # the agents see it in their prompts
         _ = self.__game.players_game_state
         player_state = self.__game.current_player_state
-        print("===" * 15, f"Turn player: {player_state.name}", "===" * 15)
-        self._write_json_log({"type": "turn_player", "value": player_state.name})
-        self._write_json_log({"type": "current_player_state", "value": player_state.get_state_log()})
+        if not self.headless:
+            print("===" * 15, f"Turn player: {player_state.name}", "===" * 15)
+            self._write_json_log({"type": "turn_player", "value": player_state.name})
+            self._write_json_log({"type": "current_player_state", "value": player_state.get_state_log()})
         self.__shared_memory.append({"type": LogEventType.TURN_PLAYER, "value": player_state.name})
         self.__game.start_of_turn()
-        self._write_json_log({"type": "current_player_state_after_draw", "value": player_state.get_state_log()})
+        if not self.headless:
+            self._write_json_log({"type": "current_player_state_after_draw", "value": player_state.get_state_log()})
         self.__print_game_state()
 
     def gui_game(self):
@@ -110,23 +219,28 @@ class GameEmulator:
         else:
             self.start_of_turn()
 
-    def __one_player_game_circle(self) -> GameResult:
-        self.start_of_turn()
-        game_result = self.__play_cards()
+    def __one_player_game_circle(self) -> Generator[dict[str, Any], Any, GameResult]:
+        if not self.__turn_started:
+            self.start_of_turn()
+        self.__turn_started = False
+        game_result = yield from self.__play_cards()
         if game_result != GameResult.NO_WINNERS:
-            print("===" * 15, "END OF GAME", "===" * 15)
-            print(game_result.name)
+            self._print("===" * 15, "END OF GAME", "===" * 15)
+            self._print(game_result.name)
             return game_result
-        self.end_of_turn()
+        yield from self._end_of_turn_steps()
         return game_result
 
     def end_of_turn(self):
-        self.__discard_cards()
+        self._run(self._end_of_turn_steps())
+
+    def _end_of_turn_steps(self) -> Generator[dict[str, Any], Any, None]:
+        yield from self.__discard_cards()
         self.__game.end_of_turn()
 
     def auto_play(self):
         while True:
-            game_result = self.__one_player_game_circle()
+            game_result = self._run(self.__one_player_game_circle())
             if game_result != GameResult.NO_WINNERS:
                 return
 
@@ -134,29 +248,164 @@ class GameEmulator:
             if isinstance(agent, UserAgent):
                 return
 
-    def play_game(self):
+    def play_game(self) -> GameResult:
+        return self._run(self._play_game_steps())
+
+    async def async_play_game(self) -> GameResult:
+        return await self._async_run(self._play_game_steps())
+
+    def _play_game_steps(self) -> Generator[dict[str, Any], Any, GameResult]:
         while True:
-            game_result = self.__one_player_game_circle()
+            if not self.__turn_started:
+                self.save_checkpoint()
+            game_result = yield from self.__one_player_game_circle()
             if game_result != GameResult.NO_WINNERS:
                 break
-        self.__exp_logger.end_run()
+        self._print("Auto decisions:", dict(self.auto_decisions))
+        agent_metrics = defaultdict(int)
+        for agent in self.__agents.values():
+            for key, value in agent.get_metrics().items():
+                agent_metrics[key] += value
+        if agent_metrics:
+            self._print("Agent metrics:", dict(agent_metrics))
+        llm_usage = self.get_llm_usage()
+        if llm_usage:
+            self._print("LLM usage:", LlmUsage.format(llm_usage))
+            self._write_llm_usage(llm_usage)
+        self.close_logs()
+        if not self.headless:
+            remove_checkpoint(self.__config.config.save_path)
+        if not self.headless and self.__config.config.get("run_archive", False):
+            pack_run(self.__config.config.save_path, remove=True)
+        if self.__exp_logger:
+            metrics = {f"auto_decisions_{decision}": count for decision, count in self.auto_decisions.items()}
+            metrics["auto_decisions"] = sum(self.auto_decisions.values())
+            metrics["game_result"] = game_result.value
+            metrics.update(agent_metrics)
+            self.__exp_logger.log_metrics(metrics)
+            self.__exp_logger.end_run(llm_usage)
+        return game_result
+
+    # The game loop is a chain of generators that yield agent calls instead of making them,
+    # like Game.play_card yields requests for responses. _run answers them with the blocking
+    # agent methods, _async_run awaits their async_ versions, so many games can share one event loop
+    @staticmethod
+    def _ask(agent: Agent, method: str, *args) -> Generator[dict[str, Any], Any, Any]:
+        return (yield {"agent": agent, "method": method, "args": args})
+
+    # independent steps, _run goes through them one by one and _async_run runs them concurrently
+    @staticmethod
+    def _gather(*steps: Generator[dict[str, Any], Any, Any]) -> Generator[dict[str, Any], Any, list[Any]]:
+        return (yield {"gather": steps})
+
+    @staticmethod
+    def _run(steps: Generator[dict[str, Any], Any, Any]) -> Any:
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    if "gather" in request:
+                        answer = [GameEmulator._run(sub_steps) for sub_steps in request["gather"]]
+                    else:
+                        request["agent"].decision = request["method"]
+                        answer = getattr(request["agent"], request["method"])(*request["args"])
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(answer)
+        except StopIteration as e:
+            return e.value
+
+    @staticmethod
+    async def _async_run(steps: Generator[dict[str, Any], Any, Any]) -> Any:
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    if "gather" in request:
+                        answer = await asyncio.gather(*(GameEmulator._async_run(sub_steps)
+                                                        for sub_steps in request["gather"]))
+                    else:
+                        request["agent"].decision = request["method"]
+                        answer = await getattr(request["agent"], f"async_{request['method']}")(*request["args"])
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(answer)
+        except StopIteration as e:
+            return e.value
+
+    # LLM usage of the run per agent, stage and decision, None if no agent called an LLM
+    def get_llm_usage(self) -> Optional[dict[str, Any]]:
+        agents_usage = {name: agent.llm_usage.as_dict() for name, agent in self.__agents.items()
+                        if agent.llm_usage.total["calls"]}
+        return LlmUsage.merge(agents_usage) if agents_usage else None
+
+    def _write_llm_usage(self, llm_usage: dict[str, Any]):
+        if self.headless:
+            return
+        with open(os.path.join(self.__config.config.save_path, LLM_USAGE_NAME), "w", encoding="utf-8") as f:
+            json.dump(llm_usage, f, indent=2)
+
+    def _print(self, *args, **kwargs):
+        if not self.headless:
+            print(*args, **kwargs)
+
+    def _pprint(self, data: Any):
+        if not self.headless:
+            pprint(data)
+
+    def _auto_decision(self, player_name: str, decision: str, value: Any):
+        self.auto_decisions[decision] += 1
+        self._write_json_log({"type": "auto_decision", "value": {"player": player_name,
+                                                                 "decision": decision,
+                                                                 "value": value}})
 
     def _write_json_log(self, data: dict[str, Any], file_name: str = "game_log.json"):
-        data["dttm"] = datetime.datetime.now(ZoneInfo("Europe/Moscow"))
-        log_file = os.path.join(self.__config.config.save_path, file_name)
-        with open(log_file, "a", encoding="utf-8") as f:
-            json.dump(data, f, cls=GameEncoder)
-            f.write('\n')
+        if self.headless:
+            return
+        data["dttm"] = datetime.datetime.now(LOG_TIMEZONE)
+        writer = self.__log_writers.get(file_name)
+        if writer is None:
+            writer = JsonlWriter(os.path.join(self.__config.config.save_path, file_name))
+            self.__log_writers[file_name] = writer
+        writer.write(data)
+
+    def __write_shared_memory_log(self, data: dict[str, Any], file_name: str):
+        if self.headless or data["type"] != LogEventType.PLAYERS_GAME_STATE:
+            self._write_json_log(data, file_name)
+            return
+        # agents keep the full state in memory, only the log file gets the delta
+        keyframe, value = self.__players_game_state_encoder.encode(data["value"])
+        event_type = LogEventType.PLAYERS_GAME_STATE if keyframe else LogEventType.PLAYERS_GAME_STATE_DELTA
+        event = {"type": event_type, "value": value}
+        self._write_json_log(event, file_name)
+        data["dttm"] = event["dttm"]
+
+    def close_logs(self):
+        for writer in self.__log_writers.values():
+            writer.close()
+        self.__log_writers = {}
+        for agent in self.__agents.values():
+            agent.close_logs()
 
     def __print_game_state(self):
-        print("===" * 15, "All player", "===" * 15)
         self.__shared_memory.append({"type": LogEventType.PLAYERS_GAME_STATE, "value": self.__game.players_game_state})
-        self._write_json_log({"type": "game_state", "value": self.__game.get_game_log()})
+        if self.headless:
+            return
+        print("===" * 15, "All player", "===" * 15)
+        keyframe, value = self.__game_state_encoder.encode(self.__game.get_game_log())
+        self._write_json_log({"type": "game_state" if keyframe else "game_state_delta", "value": value})
         pprint(self.__game.players_game_state)
         print("===" * 15, "Current player", "===" * 15)
         print(self.__game.current_player_state)
 
     def play_card(self, card:  dict[str, dict[str, Any] | Card] | str) -> dict[str, Union[GameResult, bool]]:
+        return self._run(self._play_card_steps(card))
+
+    def _play_card_steps(self, card:  dict[str, dict[str, Any] | Card] | str) -> Generator[dict[str, Any], Any,
+                                                                                    dict[str, Union[GameResult, bool]]]:
+        self.actions_count += 1
         self.__shared_memory.append({"type": LogEventType.PLAY_CARD, "value": card})
         self._write_json_log({"type": "play_card", "value": card})
         if card != "end":
@@ -165,18 +414,21 @@ class GameEmulator:
             try:
                 request = next(generator_play_card)
                 while True:
-                    response = self.__get_opponent_response_for_card(request)
+                    if "requests" in request:
+                        response = yield from self.__get_opponent_responses_for_card(request["requests"])
+                    else:
+                        response = yield from self.__get_opponent_response_for_card(request)
                     request = generator_play_card.send(response)
             except StopIteration as e:
-                print("Step result")
-                pprint(e.value)
+                self._print("Step result")
+                self._pprint(e.value)
                 self.__shared_memory.append({"type": LogEventType.STEP_RESULT, "value": e.value})
                 self._write_json_log({"type": "step_result", "value": e.value})
                 if e.value["game_status"] != GameResult.NO_WINNERS:
                     self._write_json_log({"type": "game_result", "value": e.value["game_status"]})
                     return {"game_result": e.value["game_status"], "end_of_turn": True}
             except Exception as e:
-                pprint(e)
+                self._pprint(e)
                 self.__shared_memory.append({"type": LogEventType.STEP_ERROR, "value": str(e)})
                 self._write_json_log({"type": "step_error", "value": str(e)})
             self.__print_game_state()
@@ -184,122 +436,198 @@ class GameEmulator:
         else:
             return {"game_result": GameResult.NO_WINNERS, "end_of_turn": True}
 
-    def __play_cards(self) -> GameResult:
+    def __play_cards(self) -> Generator[dict[str, Any], Any, GameResult]:
         while True:
-            card = self.get_card_for_play()
-            card_result = self.play_card(card)
+            card = yield from self._card_for_play_steps()
+            card_result = yield from self._play_card_steps(card)
             if card_result["end_of_turn"]:
                 return card_result["game_result"]
 
-    def __discard_cards(self):
+    def __discard_cards(self) -> Generator[dict[str, Any], Any, None]:
         player_state = self.__game.current_player_state
         need_to_discard = player_state.need_to_discard()
         if need_to_discard > 0:
-            print(f"Need to discard {need_to_discard} cards")
-            print(f"Please make a choice")
-            print(player_state)
+            self._print(f"Need to discard {need_to_discard} cards")
+            self._print(f"Please make a choice")
+            self._print(player_state)
             self.__shared_memory.append({"type": LogEventType.NEED_DISCARD_CARDS,
                                "value": f"Player {player_state.name} need to discard {need_to_discard} cards"})
             self._write_json_log({"type": "need_to_discard", "value": need_to_discard})
             agent = self.__agents[player_state.name]
-            while True:
-                try:
-                    cards_for_discard = self.__get_cards_for_discard(need_to_discard, player_state, agent)
-                    break
-                except Exception as e:
-                    agent.react_to_discard_error(str(e))
+            hand = player_state.get_hand()
+            if len(set(hand)) == 1 and not self.__legacy_decisions:
+                # the only forced discard resolved without the agent: every card in hand is the same,
+                # so any choice discards the same cards. Hands with different cards always go to the agent
+                cards_for_discard = [hand[0]] * need_to_discard
+                self._auto_decision(player_state.name, "get_card_for_discard",
+                                    " ".join(card.card_id.value for card in cards_for_discard))
+            else:
+                while True:
+                    try:
+                        cards_for_discard = yield from self.__get_cards_for_discard(need_to_discard,
+                                                                                    player_state, agent)
+                        break
+                    except Exception as e:
+                        yield from self._ask(agent, "react_to_discard_error", str(e))
 
             self._write_json_log({"type": "discarded_cards", "value": cards_for_discard})
             player_state.discard_cards_from_hand(cards_for_discard)
-            print("===" * 30)
-            print(f"Player state after discard cards")
-            print(player_state)
+            self._print("===" * 30)
+            self._print(f"Player state after discard cards")
+            self._print(player_state)
         else:
-            print(f"Player state")
-            print(player_state)
+            self._print(f"Player state")
+            self._print(player_state)
 
     def get_card_for_play(self, preselect_card_id: str = None) -> dict[str, dict[str, Any] | Card] | str:
-        def get_card_options(card: Card, agent: Agent) -> dict[str, Any]:
-            def get_opponent(card: Card, agent: Agent) -> str:
-                while True:
+        return self._run(self._card_for_play_steps(preselect_card_id))
 
-                    opponent = agent.get_opponent(card)
-                    if opponent in self.__game.get_player_names():
-                        return opponent
-                    else:
-                        print(f"That player {opponent} doesn't exist")
-                        self.__shared_memory.append(
-                            {"type": LogEventType.DRAFT_PLAY_CARD_OPTION_FAIL,
-                             "value": f"That player {opponent} doesn't exist"})
-                        self._write_json_log({"type": "draft_play_card_option_fail",
-                                                "value": {"fail": "That player doesn't exist",
-                                                         "value": opponent}})
-
-            def get_action_type(card: Card, options: dict, agent: Agent) -> str:
-                while True:
-                    action_type = agent.get_action_type(card, options)
-                    if action_type in ("from_hand", "from_play"):
-                        return action_type
-                    else:
-                        print("Allowable options (from_hand, from_play)")
-                        self.__shared_memory.append(
-                            {"type": LogEventType.DRAFT_PLAY_CARD_OPTION_FAIL,
-                             "value": f"Action_type {action_type} not allowed. Allowable options (from_hand, from_play)"})
-                        self._write_json_log({"type": "draft_play_card_option_fail", "value": {"fail": "Action_type not allowed",
-                                                                                                "value": action_type}})
-                                                   
-
-            def get_card_for_steal(card: Card, options: dict, agent: Agent) -> str:
-                while True:
-                    card_name = agent.get_card_for_steal(card, options)
-                    try:
-                        Card(CardID(card_name))
-                        return card_name
-                    except:
-                        print(f"Card {card_name} doesn't exist in the game")
-                        self.__shared_memory.append(
-                            {"type": LogEventType.DRAFT_PLAY_CARD_OPTION_FAIL,
-                             "value": f"Card {card_name} doesn't exist in the game"})
-                        self._write_json_log({"type": "draft_play_card_option_fail", "value": {"fail": "Card doesn't exist in the game",
-                                                                                                "value": card_name}})
+    def _card_for_play_steps(self, preselect_card_id: str = None) -> Generator[dict[str, Any], Any,
+                                                                             dict[str, dict[str, Any] | Card] | str]:
+        def option_fail(fail: str, value: str, message: str):
+            self._print(message)
+            self.__shared_memory.append({"type": LogEventType.DRAFT_PLAY_CARD_OPTION_FAIL, "value": message})
+            self._write_json_log({"type": "draft_play_card_option_fail", "value": {"fail": fail, "value": value}})
 
+        def get_opponent(card: Card, options: dict, opponents: list[str],
+                         agent: Agent) -> Generator[dict[str, Any], Any, str]:
+            while True:
+                opponent = yield from self._ask(agent, "get_opponent", card, opponents)
+                if opponent in opponents:
+                    return opponent
+                else:
+                    option_fail("That player can't be chosen", opponent,
+                                f"That player {opponent} can't be chosen. Available opponents ({', '.join(opponents)})")
+
+        def get_action_type(card: Card, options: dict, action_types: list[str],
+                            agent: Agent) -> Generator[dict[str, Any], Any, str]:
+            while True:
+                action_type = yield from self._ask(agent, "get_action_type", card, options)
+                if action_type in action_types:
+                    return action_type
+                else:
+                    option_fail("Action_type not allowed", action_type,
+                                f"Action_type {action_type} not allowed. Allowable options ({', '.join(action_types)})")
+
+        def get_card_for_steal(card: Card, options: dict, card_names: list[str],
+                               agent: Agent) -> Generator[dict[str, Any], Any, str]:
+            while True:
+                card_name = yield from self._ask(agent, "get_card_for_steal", card, options)
+                if card_name in card_names:
+                    return card_name
+                else:
+                    option_fail("The opponent doesn't have this card in the game", card_name,
+                                f"The opponent doesn't have card {card_name} in the game. "
+                                f"Available cards ({', '.join(card_names)})")
+
+        # Options are narrowed down with the legal moves for the card,
+        # the agent is asked only when there is more than one choice left
+        def get_card_options(card: Card, legal_options: list[dict[str, Any]],
+                             agent: Agent) -> Generator[dict[str, Any], Any, dict[str, Any]]:
             options = {}
-            match card.card_id:
-                case CardID.PANIC | CardID.HOTTIE:
-                    options["opponent"] = get_opponent(card, agent)
-                    options["action_type"] = get_action_type(card, options, agent)
-                    if options["action_type"] == "from_play":
-                        options["card"] = get_card_for_steal(card, options, agent)
-                case CardID.BANG:
-                    options["opponent"] = get_opponent(card, agent)
+            for key, decision, ask in (("opponent", "get_opponent", get_opponent),
+                                       ("action_type", "get_action_type", get_action_type),
+                                       ("card", "get_card_for_steal", get_card_for_steal)):
+                choices = list(dict.fromkeys(legal[key] for legal in legal_options if key in legal))
+                if not choices:
+                    break
+                if len(choices) == 1:
+                    options[key] = choices[0]
+                    self._auto_decision(agent.name, decision, choices[0])
+                else:
+                    options[key] = yield from ask(card, options, choices, agent)
+                legal_options = [legal for legal in legal_options if legal.get(key) == options[key]]
+            return options
+
+        # The questions of the emulator before the legal move checks (llm_replay_legacy): any player can be named,
+        # only unknown names and cards are rejected, the engine checks the move itself
+        def get_legacy_card_options(card: Card, agent: Agent) -> Generator[dict[str, Any], Any, dict[str, Any]]:
+            options = {}
+            if card.card_id in (CardID.PANIC, CardID.HOTTIE, CardID.BANG):
+                opponents = [player for player in self.__game.get_player_names() if player != agent.name]
+                while True:
+                    opponent = yield from self._ask(agent, "get_opponent", card, opponents)
+                    if opponent in self.__game.get_player_names():
+                        options["opponent"] = opponent
+                        break
+                    option_fail("That player doesn't exist", opponent, f"That player {opponent} doesn't exist")
+            if card.card_id in (CardID.PANIC, CardID.HOTTIE):
+                options["action_type"] = yield from get_action_type(card, options, ["from_hand", "from_play"], agent)
+                if options["action_type"] == "from_play":
+                    while True:
+                        card_name = yield from self._ask(agent, "get_card_for_steal", card, options)
+                        if card_name in [card_id.value for card_id in CardID]:
+                            options["card"] = card_name
+                            break
+                        option_fail("Card doesn't exist in the game", card_name,
+                                    f"Card {card_name} doesn't exist in the game")
             return options
 
         agent = self.current_agent
+        player_state = self.__game.current_player_state
         while True:
+            if not preselect_card_id and not self.__legacy_decisions and not self.__game.legal_actions(player_state):
+                self._auto_decision(agent.name, "choice_card_for_play", "end")
+                return "end"
             card_id = preselect_card_id if preselect_card_id\
-                                        else agent.choice_card_for_play()
+                                        else (yield from self._ask(agent, "choice_card_for_play"))
+            preselect_card_id = None
+            if card_id == "end":
+                return "end"
             try:
-                if card_id == "end":
-                    return "end"
                 card = Card(CardID(card_id))
-                options = get_card_options(card, agent)
-                return {"card": card, "options": options}
             except ValueError:
-                print(f"Card {card_id} doesn't exist in the game")
+                self._print(f"Card {card_id} doesn't exist in the game")
                 self.__shared_memory.append(
                     {"type": LogEventType.DRAFT_PLAY_CARD_FAIL,
                      "value": f"Card {card_id} doesn't exist in the game"})
                 self._write_json_log({"type": "draft_play_card_fail", "value": {"fail": "Card doesn't exist in the game",
                                                                                 "value": card_id}})
+                continue
 
-    def __get_opponent_response_for_card(self, request: dict[str, Any]) -> dict[str, PlayerActionResponse]:
-        def indians_response(agent: Agent) -> PlayerActionResponse:
+            if self.__legacy_decisions:
+                options = yield from get_legacy_card_options(card, agent)
+                return {"card": card, "options": options}
+
+            legal_options = [options for legal_card, options in self.__game.legal_actions(player_state)
+                             if legal_card is card]
+            if legal_options:
+                options = yield from get_card_options(card, legal_options, agent)
+                return {"card": card, "options": options}
+
+            fail = self.__get_card_reject_reason(card, player_state)
+            self._print(fail)
+            self.__shared_memory.append({"type": LogEventType.DRAFT_PLAY_CARD_FAIL, "value": fail})
+            self._write_json_log({"type": "draft_play_card_fail", "value": {"fail": fail, "value": card_id}})
+
+    @staticmethod
+    def __get_card_reject_reason(card: Card, player_state: Player) -> str:
+        if not player_state.has_card(card):
+            return f"Card {card.card_id.value} not in hand"
+        match card.card_id:
+            case CardID.BANG:
+                if not player_state.can_use_weapon:
+                    return "You've used up all your shots this turn"
+                return "No opponent within the range of your weapon"
+            case CardID.PANIC:
+                return "No opponent with cards at distance 1"
+            case CardID.HOTTIE:
+                return "No opponent has cards to discard"
+            case CardID.BEER:
+                return "The player is at maximum health, the beer has no effect"
+            case CardID.MISS:
+                return "Miss can only be played in response to bang or gatling"
+        return f"Card {card.card_id.value} can't be played now"
+
+    def __get_opponent_response_for_card(self, request: dict[str, Any]) -> Generator[dict[str, Any], Any,
+                                                                                 dict[str, PlayerActionResponse]]:
+        def indians_response(agent: Agent) -> Generator[dict[str, Any], Any, PlayerActionResponse]:
             while True:
-                response = agent.get_indians_response()
+                response = yield from self._ask(agent, "get_indians_response")
                 if response in ("bang", "pass"):
                     return PlayerActionResponse(response)
                 else:
-                    print("Acceptable options (bang, pass)")
+                    self._print("Acceptable options (bang, pass)")
                     self.__shared_memory.append(
                         {"type": LogEventType.RESPONSE_FOR_CARD_FAIL,
                          "value": f"The response {response} is not acceptable. Acceptable options (bang, pass)"})
@@ -307,13 +635,13 @@ class GameEmulator:
                                                                                         "fail": "The response is not acceptable",
                                                                                         "value": response}})
 
-        def bang_response(agent: Agent) -> PlayerActionResponse:
+        def bang_response(agent: Agent) -> Generator[dict[str, Any], Any, PlayerActionResponse]:
             while True:
-                response = agent.get_bang_response()
+                response = yield from self._ask(agent, "get_bang_response")
                 if response in ("miss", "pass"):
                     return PlayerActionResponse(response)
                 else:
-                    print("Acceptable options (miss, pass)")
+                    self._print("Acceptable options (miss, pass)")
                     self.__shared_memory.append(
                         {"type": LogEventType.RESPONSE_FOR_CARD_FAIL,
                          "value": f"The response {response} is not acceptable. Acceptable options (miss, pass)"})
@@ -321,13 +649,13 @@ class GameEmulator:
                                                                                         "fail": "The response is not acceptable",
                                                                                         "value": response}})
 
-        def gatling_response(agent: Agent) -> PlayerActionResponse:
+        def gatling_response(agent: Agent) -> Generator[dict[str, Any], Any, PlayerActionResponse]:
             while True:
-                response = agent.get_gatling_response()
+                response = yield from self._ask(agent, "get_gatling_response")
                 if response in ("miss", "pass"):
                     return PlayerActionResponse(response)
                 else:
-                    print("Acceptable options (miss, pass)")
+                    self._print("Acceptable options (miss, pass)")
                     self.__shared_memory.append(
                         {"type": LogEventType.RESPONSE_FOR_CARD_FAIL,
                          "value": f"The response {response} is not acceptable. Acceptable options (miss, pass)"})
@@ -337,33 +665,35 @@ class GameEmulator:
 
         response = {}
         opponent = request['opponent']
-        player_state = self.__game.current_player_state
-        assert opponent == player_state.name
+        player_state = self.__game.get_player(opponent)
         agent = self.__agents[opponent]
 
-        print("===" * 15, f"Reaction for player: {player_state.name}", "===" * 15)
+        self._print("===" * 15, f"Reaction for player: {player_state.name}", "===" * 15)
         is_auto_response = False
         match request['request']:
             case CardActionRequest.RESPONSE_TO_INDIANS:
-                if player_state.has_card(Card(CardID.BANG)):
-                    response["action"] = indians_response(agent)
+                if player_state.has_card(BANG):
+                    response["action"] = yield from indians_response(agent)
                 else:
                     response["action"] = PlayerActionResponse.PASS
                     is_auto_response = True
+                    self._auto_decision(opponent, "get_indians_response", PlayerActionResponse.PASS.value)
             case CardActionRequest.RESPONSE_TO_BANG:
-                if player_state.has_card(Card(CardID.MISS)):
-                    response["action"] = bang_response(agent)
+                if player_state.has_card(MISS):
+                    response["action"] = yield from bang_response(agent)
                 else:
                     response["action"] = PlayerActionResponse.PASS
                     is_auto_response = True
+                    self._auto_decision(opponent, "get_bang_response", PlayerActionResponse.PASS.value)
             case CardActionRequest.RESPONSE_TO_GATLING:
-                if player_state.has_card(Card(CardID.MISS)):
-                    response["action"] = gatling_response(agent)
+                if player_state.has_card(MISS):
+                    response["action"] = yield from gatling_response(agent)
                 else:
                     response["action"] = PlayerActionResponse.PASS
                     is_auto_response = True
+                    self._auto_decision(opponent, "get_gatling_response", PlayerActionResponse.PASS.value)
 
-        print(response)
+        self._print(response)
         self.__shared_memory.append(
             {"type": LogEventType.RESPONSE_FOR_CARD,
              "value": f"Reaction for player {player_state.name} for {request['request'].value} is {response["action"].value}"})
@@ -372,16 +702,18 @@ class GameEmulator:
                                                                         "is_auto_response": is_auto_response}})
         return response
 
-    def __get_cards_for_discard(self, num_discard_cards: int, player_state: Player, agent: Agent) -> list[Card]:
+    def __get_opponent_responses_for_card(self, requests: list[dict[str, Any]]) -> Generator[dict[str, Any], Any,
+                                                                                        dict[str, Any]]:
+        responses = yield from self._gather(*(self.__get_opponent_response_for_card(request) for request in requests))
+        return {"responses": {request["opponent"]: response for request, response in zip(requests, responses)}}
+
+    def __get_cards_for_discard(self, num_discard_cards: int, player_state: Player,
+                                agent: Agent) -> Generator[dict[str, Any], Any, list[Card]]:
         cards_for_discard = []
-        hand = player_state.get_state_log()["hand"]
+        hand = player_state.get_hand()
         assert len(hand) > num_discard_cards
 
-        hand_count = defaultdict(int)
-        for card in hand:
-            hand_count[card] += 1
-
-        player_input = agent.get_card_for_discard(num_discard_cards)
+        player_input = yield from self._ask(agent, "get_card_for_discard", num_discard_cards)
 
         errors = []
         for card_id in player_input.split():
@@ -395,8 +727,9 @@ class GameEmulator:
         for card in cards_for_discard:
             disc_count[card] += 1
         for k, v in disc_count.items():
-            if hand_count[k] < v:
-                if hand_count[k] == 0:
+            hand_count = hand.count(k)
+            if hand_count < v:
+                if hand_count == 0:
                     errors.append(f"Card {k.card_id.value} is not in the player's hand")
                 else:
                     errors.append(f"Cards {k.card_id.value} is less than {v}. You can't drop that many cards")
@@ -3,7 +3,6 @@ from enum import Enum
 from typing import Any, Callable
 import dearpygui.dearpygui as dpg
 
-from src.game.Config import Config
 from src.game.Utils import GameEncoder
 
 
@@ -15,16 +14,18 @@ class LoggedList(list):
     def __init__(self,
                  log_func: Callable[[dict[str, Any], str], None],
                  file_name: SavePath,
+                 gui: bool = False,
                  *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__log_func = log_func
         self.__file_name = file_name
+        self.__gui = gui
 
     def append(self, data: dict[str, Any]) -> None:
         super().append(data)
         self.__log_func(data, self.__file_name.value)
 
-        if Config().config.gui:
+        if self.__gui:
             data = json.dumps(data, indent=2, ensure_ascii=False, cls=GameEncoder)
             match self.__file_name:
                 case SavePath.SHARED_MEMORY:
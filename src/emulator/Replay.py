@@ -0,0 +1,229 @@
+import json
+import os.path
+from typing import Any, Optional
+
+from omegaconf import OmegaConf, DictConfig
+
+from src.emulator.Emulator import GameEmulator, LogEventType
+from src.emulator.LoggedList import SavePath
+from src.game.Card import Card, CardID
+from src.game.Game import Game, GameResult
+from src.game.Player import PlayerActionResponse
+from src.observ.RunArchive import read_run_json, read_run_jsonl
+from src.observ.StateDelta import StateHistory, to_plain
+
+GAME_LOG = "game_log.json"
+RESULT_EVENTS = ("step_result", "step_error", "play_card", "turn_player")
+
+
+# Re-drives a headless Game with the decisions recorded in game_log.json, no agents are called.
+# Every logged game state is compared with the replayed one. Runs recorded without a seed
+# (or before an engine change) can't repeat the random draws, there the logged state wins
+# and the game is synced to it, `resyncs` counts such corrections.
+# A run recorded with its seed must repeat without corrections: every resync there is reported
+# as a warning, or raised with `strict`. The result is the one of the engine, a different recorded
+# result is reported the same way.
+# A step is one play_card decision, like GameEmulator.actions_count.
+class GameReplay:
+    def __init__(self, run_path: str, strict: bool = False):
+        self.run_path = run_path
+        self.strict = strict
+        init_log = read_run_json(run_path, "game_init.json")
+        self.config = OmegaConf.create(init_log["config"])
+        self.config.headless = True
+        self.config.gui = False
+        self.config.resume = False
+        self.seeded = "seed" in init_log
+        self.seed = init_log.get("seed", self.config.seed)
+        self.game = Game(self.config, seed=self.seed)
+        self.step = 0
+        self.resyncs = 0
+        self.game_result = GameResult.NO_WINNERS
+        self.recorded_result = None
+        self.__game_log = read_run_jsonl(run_path, GAME_LOG)
+        self.__position = 0
+        # position in the log right after the last logged state, the game is exactly in this state
+        self.__state_position = 0
+        self.__states = StateHistory()
+        self.__turn_started = False
+        self.__sync(init_log)
+
+    def replay(self, until_step: Optional[int] = None) -> GameResult:
+        while self.__position < len(self.__game_log):
+            event = self.__game_log[self.__position]
+            match event["type"]:
+                case "turn_player":
+                    if self.__turn_started:
+                        self.game.end_of_turn()
+                    if self.game.current_player_state.name != event["value"]:
+                        # e.g. runs recorded before the turn order fix skipped a player after a death
+                        self.__resync(f"the turn of {self.game.current_player_state.name} "
+                                      f"instead of the recorded {event['value']}")
+                        snapshot = self.game.snapshot()
+                        snapshot["current_turn"] = snapshot["players_order"].index(event["value"])
+                        self.game.restore(snapshot)
+                    self.game.start_of_turn()
+                    self.__turn_started = True
+                case "play_card":
+                    if until_step is not None and self.step >= until_step:
+                        break
+                    self.__play_card(event["value"])
+                    self.step += 1
+                case "discarded_cards":
+                    cards = [Card(CardID(card["card_id"])) for card in event["value"]]
+                    self.game.current_player_state.discard_cards_from_hand(cards)
+                case "game_state":
+                    self.__states.add_keyframe(event["value"])
+                    self.__sync(self.__states.last())
+                    self.__state_position = self.__position + 1
+                case "game_state_delta":
+                    self.__states.add_delta(event["value"])
+                    self.__sync(self.__states.last())
+                    self.__state_position = self.__position + 1
+                case "game_result":
+                    self.recorded_result = GameResult[event["value"]["name"]]
+                    if self.recorded_result != self.game_result:
+                        self.__report(f"The replayed game ended with {self.game_result.name}, "
+                                      f"the recorded one with {self.recorded_result.name}", True)
+            self.__position += 1
+        if until_step is not None and self.step < until_step:
+            raise Exception(f"The run has only {self.step} steps")
+        return self.game_result
+
+    # State for GameEmulator.continue_from: the game before the next decision and the logs up to it
+    def get_fork_state(self) -> dict[str, Any]:
+        if self.game_result != GameResult.NO_WINNERS:
+            raise Exception("The game is already over, nothing to fork")
+        shared_memory_log = read_run_jsonl(self.run_path, SavePath.SHARED_MEMORY.value)
+        # the shared memory is cut the same way: after the last state before the next decision
+        play_cards = 0
+        state_position = 0
+        for position, event in enumerate(shared_memory_log):
+            event_type = event["type"]["name"]
+            if event_type == LogEventType.PLAY_CARD.name:
+                if play_cards == self.step:
+                    break
+                play_cards += 1
+            elif event_type in (LogEventType.PLAYERS_GAME_STATE.name, LogEventType.PLAYERS_GAME_STATE_DELTA.name):
+                state_position = position + 1
+        shared_memory_log = shared_memory_log[:state_position]
+
+        shared_memory = []
+        states = StateHistory()
+        for event in shared_memory_log:
+            event_type = LogEventType[event["type"]["name"]]
+            value = event["value"]
+            if event_type == LogEventType.PLAYERS_GAME_STATE:
+                states.add_keyframe(value)
+            elif event_type == LogEventType.PLAYERS_GAME_STATE_DELTA:
+                # agents get full states in memory
+                states.add_delta(value)
+                event_type, value = LogEventType.PLAYERS_GAME_STATE, states.last()
+            shared_memory.append({**event, "type": event_type, "value": value})
+
+        return {
+            "source_run": self.run_path,
+            "step": self.step,
+            "game": self.game.snapshot(),
+            "shared_memory": shared_memory,
+            GAME_LOG: self.__game_log[:self.__state_position],
+            SavePath.SHARED_MEMORY.value: shared_memory_log,
+        }
+
+    # New run of the game from the current step, `override` is merged into the run config (e.g. other agents)
+    def fork(self, override: Optional[DictConfig] = None, exp_name: Optional[str] = None,
+             headless: bool = False) -> GameEmulator:
+        config = OmegaConf.create(OmegaConf.to_container(self.config))
+        for key in ("headless", "gui", "resume"):
+            config.pop(key, None)
+        if override is not None:
+            config = OmegaConf.merge(config, override)
+        config.exp_name = exp_name or f"{config.exp_name}_fork"
+        config.save_path = f"save/{config.exp_name}"
+        emulator = GameEmulator(config, headless=headless, seed=self.seed)
+        emulator.continue_from(self.get_fork_state())
+        return emulator
+
+    def __play_card(self, card: Any):
+        if card == "end":
+            return
+        responses = []
+        position = self.__position + 1
+        while position < len(self.__game_log) and self.__game_log[position]["type"] not in RESULT_EVENTS:
+            if self.__game_log[position]["type"] == "response_for_card":
+                responses.append(self.__game_log[position]["value"])
+            position += 1
+
+        def get_response(opponent: str) -> dict[str, PlayerActionResponse]:
+            for index, response in enumerate(responses):
+                if response["user"] == opponent:
+                    del responses[index]
+                    return {"action": PlayerActionResponse(response["reaction"])}
+            return {"action": PlayerActionResponse.PASS}
+
+        generator_play_card = self.game.play_card(Card(CardID(card["card"]["card_id"])), options=card["options"])
+        try:
+            request = next(generator_play_card)
+            while True:
+                if "requests" in request:
+                    response = {"responses": {opponent_request["opponent"]: get_response(opponent_request["opponent"])
+                                              for opponent_request in request["requests"]}}
+                else:
+                    response = get_response(request["opponent"])
+                request = generator_play_card.send(response)
+        except StopIteration as e:
+            if e.value["game_status"] != GameResult.NO_WINNERS:
+                self.game_result = e.value["game_status"]
+        except Exception:
+            # the recorded step failed in the engine too (step_error), the state is unchanged
+            pass
+
+    def __sync(self, state: dict[str, Any]):
+        game_log = to_plain(self.game.get_game_log())
+        differences = [key for key in ("deck_and_discard", "players", "players_order") if game_log[key] != state[key]]
+        if differences:
+            self.__resync(f"the game state differs from the log in {', '.join(differences)}")
+            self.game.restore_game_log(state)
+
+    def __resync(self, difference: str):
+        self.resyncs += 1
+        if self.seeded:
+            self.__report(f"Step {self.step}: {difference} in the run recorded with seed {self.seed}, "
+                          f"the engine doesn't repeat the recorded game", False)
+
+    def __report(self, message: str, always: bool):
+        if self.strict:
+            raise Exception(message)
+        if always or self.seeded:
+            print(f"WARNING: {message}")
+
+
+# Plays a recorded run again with its own agents, every LLM call is answered from the agents' local logs
+# (src/agent/ReplayClient.py), so the agents, the emulator and the logs run offline.
+# The recorded seed repeats the game, runs recorded without a seed get their initial deal from game_init.json;
+# if the game still goes another way, the first request with no recorded answer stops it.
+# legacy replays runs recorded before the legal move checks and automatic decisions: the emulator asks
+# the agents every decision as then, and they get the recorded answers in order
+def replay_with_agents(run_path: str, exp_name: Optional[str] = None, headless: bool = False,
+                       legacy: bool = False) -> GameEmulator:
+    init_log = read_run_json(run_path, "game_init.json")
+    config = OmegaConf.create(init_log["config"])
+    for key in ("headless", "gui", "resume"):
+        config.pop(key, None)
+    config.llm_replay_run = run_path
+    config.llm_replay_legacy = legacy
+    # the run path is a part of the config, so every source run gets its own experiment by default
+    config.exp_name = exp_name or f"{config.exp_name}_offline_{os.path.basename(os.path.normpath(run_path))[:8]}"
+    config.save_path = f"save/{config.exp_name}"
+    emulator = GameEmulator(config, headless=headless, seed=init_log.get("seed", config.seed))
+    if "seed" not in init_log:
+        emulator.game.restore_game_log(init_log)
+        if not headless:
+            init_path = os.path.join(emulator.game.config.save_path, "game_init.json")
+            with open(init_path, "r", encoding="utf-8") as f:
+                new_init_log = json.load(f)
+            for key in ("deck_and_discard", "players", "players_order"):
+                new_init_log[key] = init_log[key]
+            with open(init_path, "w", encoding="utf-8") as f:
+                json.dump(new_init_log, f, indent=4)
+    return emulator
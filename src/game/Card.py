@@ -32,28 +32,41 @@ class CardActionRequest(Enum):
       RESPONSE_TO_INDIANS = "response to indians"
 
 
+# Cards are interned: Card(card_id) always returns the same object,
+# so cards are compared by identity and never allocated after the first lookup
 class Card:
-    def __init__(self, card_id: CardID):
-        self.card_id = card_id
-        self.card_type = self.__get_card_type()
+    __slots__ = ("card_id", "card_type", "index")
+    __cards: dict[CardID, "Card"] = {}
+
+    def __new__(cls, card_id: CardID):
+        card = cls.__cards.get(card_id)
+        if card is None:
+            card = super().__new__(cls)
+            card.card_id = card_id
+            card.card_type = Card.__get_card_type(card_id)
+            card.index = list(CardID).index(card_id)
+            cls.__cards[card_id] = card
+        return card
 
     def __repr__(self):
         return str({"card_id": self.card_id.name,
                 "card_type": self.card_type.name})
 
-    def __hash__(self):
-        return hash((self.card_id, self.card_type))
+    def __reduce__(self):
+        return Card, (self.card_id,)
+
+    def __copy__(self):
+        return self
 
-    def __eq__(self, other):
-        if isinstance(other, Card):
-            return self.card_id.value == other.card_id.value and self.card_type.value == other.card_type.value
-        return False
+    def __deepcopy__(self, memo):
+        return self
 
     def __str__(self):
         return f"Card name: {self.card_id.value} \nCard type: {self.card_type.name}"
 
-    def __get_card_type(self) -> CardType:
-        match self.card_id:
+    @staticmethod
+    def __get_card_type(card_id: CardID) -> CardType:
+        match card_id:
             case CardID.WINCHESTER | CardID.CARBINE | CardID.REMINGTON | CardID.SCOFIELD | CardID.VOLKANIC:
                 return CardType.WEAPON
             case CardID.MUSTANG | CardID.SCOPE:
@@ -77,3 +90,10 @@ class Card:
                 raise Exception("Support only CardType.WEAPON")
 
 
+# shared instances for the engine hot path
+BANG = Card(CardID.BANG)
+MISS = Card(CardID.MISS)
+BEER = Card(CardID.BEER)
+SCOPE = Card(CardID.SCOPE)
+MUSTANG = Card(CardID.MUSTANG)
+VOLKANIC = Card(CardID.VOLKANIC)
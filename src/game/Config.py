@@ -1,24 +1,67 @@
-from omegaconf import OmegaConf
+import copy
+from typing import Any, Union
+
+from omegaconf import OmegaConf, DictConfig
 from git import Repo
 
-class Config:
-    _instance = None
+# Config of a batch of headless games resolved once into plain dicts and lists (OmegaConf.to_container).
+# Keys are read as attributes or items like in DictConfig, but they are dict lookups, and the config is
+# read-only, so all games of the batch share one copy
+class ResolvedConfig(dict):
+    def __init__(self, values: dict[str, Any]):
+        super().__init__((key, ResolvedConfig.__freeze(value)) for key, value in values.items())
+
+    # the config of headless games: no gui, logs or checkpoints
+    @staticmethod
+    def create(config: DictConfig) -> "ResolvedConfig":
+        values = OmegaConf.to_container(config, resolve=True)
+        values.update(gui=False, headless=True, resume=False)
+        return ResolvedConfig(values)
+
+    @staticmethod
+    def __freeze(value: Any) -> Any:
+        if isinstance(value, dict):
+            return ResolvedConfig(value)
+        if isinstance(value, list):
+            return [ResolvedConfig.__freeze(item) for item in value]
+        return value
+
+    def __getattr__(self, key: str) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
 
+    def __setattr__(self, key: str, value: Any):
+        raise Exception(f"ResolvedConfig is read-only, can't set {key}")
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(Config, cls).__new__(cls)
-            cls._instance.config = None
-        return cls._instance
+    def __setitem__(self, key: str, value: Any):
+        raise Exception(f"ResolvedConfig is read-only, can't set {key}")
 
-    @classmethod
-    def init(cls, path: str):
-        if cls._instance.config is None:
-            cls._instance.config = OmegaConf.load(path)
+    def __delitem__(self, key: str):
+        raise Exception(f"ResolvedConfig is read-only, can't delete {key}")
 
+    def __reduce__(self):
+        return ResolvedConfig, (dict(self),)
+
+    def __deepcopy__(self, memo: dict) -> "ResolvedConfig":
+        return self
+
+
+# Per-game configuration context. Every game gets its own copy of the config,
+# so one process can run several games with different configs side by side.
+# A ResolvedConfig is read-only and is shared instead
+class Config:
+    def __init__(self, config: Union[str, DictConfig, ResolvedConfig]):
+        if isinstance(config, ResolvedConfig):
+            self.config = config
+        elif isinstance(config, DictConfig):
+            self.config = copy.deepcopy(config)
+        else:
+            self.config = OmegaConf.load(config)
 
-    @classmethod
-    def set_git_commit_hash(cls):
+    @staticmethod
+    def set_git_commit_hash(config: DictConfig):
 
         def __get_git_commit_hash():
             try:
@@ -29,4 +72,4 @@ class Config:
                 print(f"Error: Could not retrieve commit hash. {e}")
                 return None
 
-        cls._instance.config.git_hash = __get_git_commit_hash()
\ No newline at end of file
+        config.git_hash = __get_git_commit_hash()
@@ -1,30 +1,46 @@
+import random
 import typing
 from collections import deque
 
-from omegaconf import OmegaConf
+from omegaconf import OmegaConf, DictConfig
 
 from src.game.Card import Card, CardID
-from src.game.Config import Config
+from src.game.Config import ResolvedConfig
 from src.game.Utils import shuffle
 
 
 class Deck:
-    def __init__(self):
-        self.__deck = self.__init_cards()
+    def __init__(self, config: DictConfig, rng: random.Random):
+        self.__rng = rng
+        self.__deck = self.__init_cards(config, rng)
         self.__discard_pile = deque()
 
     def get_state_log(self):
         return {"deck": self.__deck, "discard_pile": self.__discard_pile}
 
+    def snapshot(self) -> tuple[deque, deque]:
+        return self.__deck.copy(), self.__discard_pile.copy()
+
+    def restore(self, snapshot: tuple[deque, deque]):
+        deck, discard_pile = snapshot
+        self.__deck = deck.copy()
+        self.__discard_pile = discard_pile.copy()
+
+    def clone(self, rng: random.Random) -> "Deck":
+        deck = Deck.__new__(Deck)
+        deck.__rng = rng
+        deck.restore((self.__deck, self.__discard_pile))
+        return deck
+
     @staticmethod
-    def __init_cards() -> deque:
+    def __init_cards(config: DictConfig, rng: random.Random) -> deque:
         cards = []
-        cards_config = OmegaConf.to_object(Config().config.cards)
+        cards_config = config.cards if isinstance(config, ResolvedConfig) else OmegaConf.to_object(config.cards)
         for card, quantity in cards_config.items():
             cards.extend([Card(CardID(card))] * quantity)
 
         cards_deque = deque(cards)
-        shuffle(cards_deque)
+        shuffle(cards_deque, rng)
         return cards_deque
 
     def discard(self, card: Card):
@@ -34,7 +50,7 @@ class Deck:
         if not self.__deck:
             self.__deck = self.__discard_pile
             self.__discard_pile = deque()
-            shuffle(self.__deck)
+            shuffle(self.__deck, self.__rng)
         if self.__deck:
             return self.__deck.pop()
         return None
\ No newline at end of file
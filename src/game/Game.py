@@ -1,17 +1,19 @@
 import json
 import os
 import random
-from collections import defaultdict
+from collections import defaultdict, Counter, deque
 from enum import Enum
+from types import MappingProxyType
 from typing import Optional, Any, Generator, Never, Union, Callable
 
-from omegaconf import OmegaConf
+from omegaconf import OmegaConf, DictConfig
 
-from src.game.Card import Card, CardType, CardID, CardActionRequest
-from src.game.Config import Config
+from src.game.Card import Card, CardType, CardID, CardActionRequest, BANG, MISS, BEER, VOLKANIC
 from src.game.Deck import Deck
+from src.game.Hand import create_hand
 from src.game.Player import Player, PlayerActionResponse
 from src.game.Role import Role
+from src.game.Seating import Seating
 from src.game.Utils import check_player_roles, GameEncoder
 
 
@@ -24,33 +26,43 @@ class GameResult(Enum):
 
 class Game:
     def __init__(self,
+                 config: DictConfig,
                  current_player_state_render: Optional[Callable[[Player],None]] = None,
-                 players_game_state_render: Optional[Callable[[dict[str, Any]],None]] = None):
+                 players_game_state_render: Optional[Callable[[dict[str, Any]],None]] = None,
+                 seed: Optional[int] = None):
         self.current_player_state_render = current_player_state_render
         self.players_game_state_render = players_game_state_render
-        self.config = Config().config
-        random.seed(self.config.seed)
+        self.config = config
+        self.gui = self.config.gui
+        self.headless = self.config.get("headless", False)
+        self.batch_responses = self.config.get("batch_responses", False)
+        self.seed = self.config.seed if seed is None else seed
+        self.rng = random.Random(self.seed)
         check_player_roles(self.config)
 
-        self.__deck = Deck()
+        self.__deck = Deck(self.config, self.rng)
         self.__players = self.__create_players()
+        self.__all_players = self.__players.copy()
         self.__players_order = [name for name in self.__players.keys()]
+        self.__seating = Seating(self.__all_players, self.__players_order)
+        self.__alive_roles = Counter(player.get_role() for player in self.__players.values())
         self.__current_turn = 0
         self._current_player_state = None
         self._players_game_state = None
-        self.__save_init_game_state()
+        if not self.headless and not self.config.get("resume", False):
+            self.__save_init_game_state()
 
     @property
     def current_player_state(self):
         if not self._current_player_state:
             self._current_player_state = self.__get_current_player_state()
-        if Config().config.gui:
+        if self.gui:
             self.current_player_state_render(self._current_player_state)
         return self._current_player_state
 
     @current_player_state.setter
     def current_player_state(self, value: Player):
-        if Config().config.gui:
+        if self.gui:
             self.current_player_state_render(value)
         self._current_player_state = value
 
@@ -58,22 +70,155 @@ class Game:
     def players_game_state(self):
         if not self._players_game_state:
             self._players_game_state = self.__get_players_game_state()
-        if Config().config.gui:
+        if self.gui:
             self.players_game_state_render(self._players_game_state)
         return self._players_game_state
 
     @players_game_state.setter
     def players_game_state(self, value: dict[str, Any]):
-        if Config().config.gui:
+        if self.gui:
             self.players_game_state_render(value)
         self._players_game_state = value
 
+    # Snapshot of the whole game state between two actions (not while play_card waits for a response).
+    # Cards are shared flyweights, so shallow copies of the containers are enough
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "deck": self.__deck.snapshot(),
+            "players": {name: player.snapshot() for name, player in self.__players.items()},
+            "players_order": self.__players_order.copy(),
+            "seating": self.__seating.get_state(),
+            "current_turn": self.__current_turn,
+            "random_state": self.rng.getstate(),
+        }
+
+    def restore(self, snapshot: dict[str, Any]):
+        self.__deck.restore(snapshot["deck"])
+        self.__players = {}
+        for name, player_snapshot in snapshot["players"].items():
+            player = self.__all_players[name]
+            player.restore(player_snapshot)
+            self.__players[name] = player
+        self.__players_order = snapshot["players_order"].copy()
+        # logged states and checkpoints of older runs have no seating, its matrix is rebuilt then
+        if "seating" in snapshot:
+            self.__seating = Seating.from_state(self.__all_players, self.__players_order, snapshot["seating"])
+        else:
+            self.__seating = Seating(self.__all_players, self.__players_order)
+        self.__alive_roles = Counter(player.get_role() for player in self.__players.values())
+        self.__current_turn = snapshot["current_turn"]
+        self.rng.setstate(snapshot["random_state"])
+        self._players_game_state = None
+        self.current_player_state = self.__get_current_player_state()
+
+    # Restores the state logged by get_game_log (plain JSON), the random state and the turn flags are kept
+    def restore_game_log(self, game_log: dict[str, Any]):
+        def get_cards(cards_log: list[dict[str, Any]]) -> list[Card]:
+            return [Card(CardID(card["card_id"])) for card in cards_log]
+
+        hand_store = self.config.get("hand_store", "list")
+        players = {}
+        for player_log in game_log["players"]:
+            weapon = player_log["weapon"]
+            if weapon != "default":
+                weapon = Card(CardID(weapon["card_id"]))
+            can_use_weapon = self.__all_players[player_log["name"]].can_use_weapon
+            players[player_log["name"]] = (create_hand(get_cards(player_log["hand"]), hand_store),
+                                           player_log["cur_hp"], weapon, player_log["weapon_range"],
+                                           can_use_weapon, get_cards(player_log["effects"]))
+        players_order = game_log["players_order"]
+        current_player = self.current_player_state.name
+        deck_log = game_log["deck_and_discard"]
+        self.restore({
+            "deck": (deque(get_cards(deck_log["deck"])), deque(get_cards(deck_log["discard_pile"]))),
+            "players": players,
+            "players_order": players_order,
+            "current_turn": players_order.index(current_player) if current_player in players_order
+            else self.__current_turn,
+            "random_state": self.rng.getstate(),
+        })
+
+    # Independent headless copy of the game for look-ahead, agents keep working with the original game
+    def clone(self) -> "Game":
+        game = Game.__new__(Game)
+        game.current_player_state_render = None
+        game.players_game_state_render = None
+        game.config = self.config
+        game.gui = False
+        game.headless = True
+        game.batch_responses = self.batch_responses
+        game.seed = self.seed
+        # Random() would seed itself from urandom before setstate overwrites the state
+        game.rng = random.Random.__new__(random.Random)
+        game.rng.setstate(self.rng.getstate())
+        game.__deck = self.__deck.clone(game.rng)
+        game.__all_players = {name: player.clone(game.__deck, game.rng)
+                              for name, player in self.__all_players.items()}
+        game.__players = {name: game.__all_players[name] for name in self.__players}
+        game.__players_order = self.__players_order.copy()
+        game.__seating = self.__seating.clone(game.__all_players, game.__players_order)
+        game.__alive_roles = self.__alive_roles.copy()
+        game.__current_turn = self.__current_turn
+        game._current_player_state = game.__get_current_player_state()
+        game._players_game_state = None
+        return game
+
     def get_player_names(self):
         return self.__players_order
 
     def get_player(self, name: str) -> Player:
         return self.__players[name]
 
+    # read-only view of the live per-role counters, it changes only when a player dies
+    def alive_roles(self) -> MappingProxyType[Role, int]:
+        return MappingProxyType(self.__alive_roles)
+
+    def distance(self, name: str, opponent: str) -> int:
+        return self.__seating.distance(name, opponent)
+
+    def get_reachable_opponents(self, name: str, max_distance: Optional[int] = None) -> list[str]:
+        if max_distance is None:
+            max_distance = self.__players[name].get_weapon_range()
+        return self.__seating.get_reachable(name, max_distance)
+
+    # All (card, options) pairs the engine accepts from the player on their turn.
+    # MISS is left out: on the player's own turn it only goes to the discard pile
+    def legal_actions(self, player: Player) -> list[tuple[Card, dict[str, Any]]]:
+        actions = []
+        for card in dict.fromkeys(player.get_hand()):
+            match card.card_id:
+                case CardID.MISS:
+                    continue
+                case CardID.BEER:
+                    if len(self.__players) <= 2 or player.get_health() < player.get_max_health():
+                        actions.append((card, {}))
+                case CardID.BANG:
+                    if player.can_use_weapon:
+                        for opponent in self.__seating.get_reachable(player.name, player.get_weapon_range()):
+                            actions.append((card, {"opponent": opponent}))
+                case CardID.PANIC:
+                    for opponent in self.__seating.get_reachable(player.name, 1):
+                        actions.extend((card, options) for options in self.__get_take_card_options(opponent))
+                case CardID.HOTTIE:
+                    for opponent in self.__players_order:
+                        if opponent != player.name:
+                            actions.extend((card, options) for options in self.__get_take_card_options(opponent))
+                case _:
+                    actions.append((card, {}))
+        return actions
+
+    def __get_take_card_options(self, opponent: str) -> list[dict[str, Any]]:
+        opponent_state = self.__players[opponent]
+        options = []
+        if len(opponent_state.get_hand()) > 0:
+            options.append({"opponent": opponent, "action_type": "from_hand"})
+        weapon = opponent_state.get_weapon()
+        if isinstance(weapon, Card):
+            options.append({"opponent": opponent, "action_type": "from_play", "card": weapon.card_id.value})
+        for effect in opponent_state.get_effects():
+            options.append({"opponent": opponent, "action_type": "from_play", "card": effect.card_id.value})
+        return options
+
     def __get_current_player_state(self) -> Player:
         return self.__players[self.__players_order[self.__current_turn]]
 
@@ -103,11 +248,12 @@ class Game:
                     outliers = yield from action_handler
                 case CardType.EFFECT:
                     self.current_player_state.play_effect_card(card)
+                    self.__seating.update_player(self.current_player_state.name)
                 case CardType.WEAPON:
                     self.current_player_state.play_weapon_card(card)
         else:
             raise Exception(f"Card {card} not in hand")
-        self.players_game_state = self.__get_players_game_state()
+        self.__update_players_game_state()
         return {"outliers": outliers, "game_status": self.__check_game_over()}
 
     def __play_action_card(self, card: Card, options: Optional[dict[str, Any]] = None) -> Generator[dict[str, Any],
@@ -119,30 +265,30 @@ class Game:
                 self.current_player_state.draw_cards(2)
             case CardID.FARGO:
                 self.current_player_state.draw_cards(3)
-            case CardID.INDIANS:
+            case CardID.INDIANS | CardID.GATLING:
+                if card.card_id == CardID.INDIANS:
+                    request_type, save_action, save_card = (CardActionRequest.RESPONSE_TO_INDIANS,
+                                                            PlayerActionResponse.BANG, BANG)
+                else:
+                    request_type, save_action, save_card = (CardActionRequest.RESPONSE_TO_GATLING,
+                                                            PlayerActionResponse.MISS, MISS)
                 opponents = [player for player in self.__players_order
                              if player != self.__players_order[self.__current_turn]]
+                # in the batch mode all opponents are asked at once: {"requests": [request, ...]} is answered
+                # with {"responses": {opponent: response}}, the damage is still dealt in seat order
+                responses = {}
+                if self.batch_responses:
+                    batch = yield {"requests": [{"request": request_type, "opponent": opponent}
+                                                for opponent in opponents]}
+                    responses = batch["responses"]
                 for opponent in opponents:
-                    request = {"request": CardActionRequest.RESPONSE_TO_INDIANS, "opponent": opponent}
                     self.current_player_state = self.__players[opponent]
-                    response = yield request
-                    if (response["action"] == PlayerActionResponse.BANG and
-                            self.current_player_state.has_card(Card(CardID.BANG))):
-                        self.current_player_state.discard_cards_from_hand(Card(CardID.BANG))
+                    if self.batch_responses:
+                        response = responses[opponent]
                     else:
-                        self.current_player_state.decrease_health()
-                        self.__beer_save()
-                        outliers |= self.__update_live_list()
-            case CardID.GATLING:
-                opponents = [player for player in self.__players_order
-                             if player != self.__players_order[self.__current_turn]]
-                for opponent in opponents:
-                    request = {"request": CardActionRequest.RESPONSE_TO_GATLING, "opponent": opponent}
-                    self.current_player_state = self.__players[opponent]
-                    response = yield request
-                    if (response["action"] == PlayerActionResponse.MISS and
-                            self.current_player_state.has_card(Card(CardID.MISS))):
-                        self.current_player_state.discard_cards_from_hand(Card(CardID.MISS))
+                        response = yield {"request": request_type, "opponent": opponent}
+                    if response["action"] == save_action and self.current_player_state.has_card(save_card):
+                        self.current_player_state.discard_cards_from_hand(save_card)
                     else:
                         self.current_player_state.decrease_health()
                         self.__beer_save()
@@ -154,7 +300,7 @@ class Game:
                 self.__check_opponent_availability(opponent)
 
                 cur_player_name = self.__players_order[self.__current_turn]
-                if self.__distance_to_opponent(cur_player_name, opponent) > 1:
+                if self.__seating.distance(cur_player_name, opponent) > 1:
                     raise Exception("The opponent is too far away")
 
                 if action_type == "from_hand":
@@ -170,6 +316,7 @@ class Game:
                         )
                     except Exception as e:
                         raise Exception(str(e))
+                    self.__seating.update_player(opponent)
             case CardID.HOTTIE:
                 opponent = options.get("opponent", "default")
                 action_type = options.get("action_type", "from_hand")
@@ -187,6 +334,7 @@ class Game:
                            self.__deck.discard(self.__players[opponent].get_card_from_game(card_for_discard))
                     except Exception as e:
                         raise Exception(str(e))
+                    self.__seating.update_player(opponent)
             case CardID.SALOON:
                 for player in self.__players.values():
                     player.increase_health()
@@ -199,21 +347,21 @@ class Game:
                 self.__check_opponent_availability(opponent)
 
                 cur_player_name = self.__players_order[self.__current_turn]
-                if (not self.__distance_to_opponent(cur_player_name, opponent)
-                        <= self.current_player_state.get_state_log()['weapon_range']):
+                if (not self.__seating.distance(cur_player_name, opponent)
+                        <= self.current_player_state.get_weapon_range()):
                     raise Exception("The opponent is too far away")
                 if not self.current_player_state.can_use_weapon:
                     raise Exception("You've used up all your shots this turn")
 
-                if self.current_player_state.get_state_log()['weapon'] != Card(CardID.VOLKANIC):
+                if self.current_player_state.get_weapon() is not VOLKANIC:
                     self.current_player_state.can_use_weapon = False
 
                 request = {"request": CardActionRequest.RESPONSE_TO_BANG, "opponent": opponent}
                 self.current_player_state = self.__players[opponent]
                 response = yield request
                 if (response["action"] == PlayerActionResponse.MISS and
-                        self.current_player_state.has_card(Card(CardID.MISS))):
-                    self.current_player_state.discard_cards_from_hand(Card(CardID.MISS))
+                        self.current_player_state.has_card(MISS)):
+                    self.current_player_state.discard_cards_from_hand(MISS)
                 else:
                     self.current_player_state.decrease_health()
                     self.__beer_save()
@@ -228,22 +376,11 @@ class Game:
         if opponent not in self.__players_order or opponent == cur_player_name:
             raise Exception("This opponent doesn't exist, or is it just you")
 
-    def __distance_to_opponent(self, cur_player_name: str, opponent: str) -> bool:
-        index_1 = self.__players_order.index(cur_player_name)
-        index_2 = self.__players_order.index(opponent)
-        num_players = len(self.__players_order)
-        dist = abs(index_1 - index_2)
-        min_dist = min(dist, num_players - dist)
-        dist_modifiers = (self.__players[opponent].get_dist_modifiers()["for_save"]
-                          - self.__players[cur_player_name].get_dist_modifiers()["for_shoot"])
-        return min_dist + dist_modifiers
-
     def __beer_save(self):
         if self.current_player_state.get_health() < 1 and len(self.__players) > 2:
-            beer_card = Card(CardID.BEER)
-            if self.current_player_state.has_card(beer_card):
+            if self.current_player_state.has_card(BEER):
                 self.current_player_state.increase_health()
-                self.current_player_state.discard_cards_from_hand(beer_card)
+                self.current_player_state.discard_cards_from_hand(BEER)
 
     def __update_live_list(self) -> Union[dict[str, Role], dict[Never]]:
         outliers = self.__check_for_update_live_list()
@@ -251,18 +388,19 @@ class Game:
             self.__make_post_death_events(outliers)
         return outliers
 
+    # only the player who has just taken damage can leave the table
     def __check_for_update_live_list(self) -> Union[dict[str, Role], dict[Never]]:
-        outliers = [player_state for player_state in self.__players.values()
-                    if player_state.get_state_log()['cur_hp'] <= 0]
-
-        for outlier in outliers:
-            key = outlier.get_state_log()['name']
-            self.__players[key].death()
-            del self.__players[key]
-            self.__players_order.remove(key)
-
-        outliers = {player.get_state_log()['name']: Role(player.get_state_log()['role']) for player in outliers}
-        return outliers
+        outlier = self.current_player_state
+        if outlier.get_health() > 0:
+            return {}
+
+        outlier.death()
+        self.__alive_roles[outlier.get_role()] -= 1
+        del self.__players[outlier.name]
+        # keep the turn on the same player when someone seated before them leaves the table
+        if self.__seating.remove(outlier.name) < self.__current_turn:
+            self.__current_turn -= 1
+        return {outlier.name: outlier.get_role()}
 
     def __make_post_death_events(self, outliers: Union[dict[str, Role], dict[Never]]):
         for outlier_role in outliers.values():
@@ -270,16 +408,13 @@ class Game:
                 case Role.BANDIT:
                     self.__get_current_player_state().draw_cards(3)
                 case Role.SHERIFF_ASSISTANT:
-                    if Role(self.__get_current_player_state().get_state_log()['role']) == Role.SHERIFF:
+                    if self.__get_current_player_state().get_role() == Role.SHERIFF:
                         self.__get_current_player_state().death()
+                        self.__seating.update_player(self.__get_current_player_state().name)
 
     def __check_game_over(self) -> GameResult:
-        alive_roles = defaultdict(int)
-        alive_num = 0
-        for player in self.__players.values():
-            player_info = player.get_state_log()
-            alive_roles[Role(player_info['role'])] += 1
-            alive_num += 1
+        alive_roles = self.__alive_roles
+        alive_num = len(self.__players)
         if alive_roles[Role.SHERIFF] == 1 and alive_roles[Role.BANDIT] == 0 and alive_roles[Role.RENEGADE] == 0:
             return GameResult.SHERIFF_WIN
         elif alive_roles[Role.SHERIFF] == 0 and (alive_roles[Role.BANDIT] > 0 or alive_roles[Role.RENEGADE] > 0):
@@ -299,7 +434,14 @@ class Game:
         else:
             self.__current_turn += 1
         self.current_player_state = self.__get_current_player_state()
-        self.players_game_state = self.__get_players_game_state()
+        self.__update_players_game_state()
+
+    def __update_players_game_state(self):
+        if self.headless:
+            # rebuild lazily on the next read
+            self._players_game_state = None
+        else:
+            self.players_game_state = self.__get_players_game_state()
 
     def __save_init_game_state(self):
         path_to_save = self.config.save_path
@@ -310,6 +452,7 @@ class Game:
 
         game_state = {
             "config": OmegaConf.to_container(self.config, resolve=True),
+            "seed": self.seed,
             "deck_and_discard": self.__deck.get_state_log(),
             "players": [player.get_state_log() for player in self.__players.values()],
             "players_order": self.__players_order
@@ -320,10 +463,11 @@ class Game:
 
     def __create_players(self) -> dict[str, Player]:
         hands = self.__init_players_hand()
+        hand_store = self.config.get("hand_store", "list")
         players = {}
         for player_config in self.config.players:
             name = player_config.name
-            players[name] = Player(self.__deck, hands[name], player_config)
+            players[name] = Player(self.__deck, create_hand(hands[name], hand_store), player_config, self.rng)
         return players
 
     def __init_players_hand(self) -> defaultdict[str, list[Card]]:
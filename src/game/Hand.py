@@ -0,0 +1,83 @@
+from typing import Iterable
+
+from src.game.Card import Card, CardID
+
+CARDS = [Card(card_id) for card_id in CardID]
+
+
+# Hand kept as the plain list of cards in draw order plus a count of every card in it,
+# updated by the methods that change the hand. Membership and count are dict lookups, indexing,
+# iteration and JSON encoding are those of the list, so the game goes exactly as with a list hand.
+# Only append, extend, insert, remove, pop and clear keep the counts, the game changes hands only with them
+class CountHand(list):
+    __slots__ = ("__counts",)
+
+    def __init__(self, cards: Iterable[Card] = ()):
+        super().__init__(cards)
+        self.__counts = {}
+        for card in self:
+            self.__counts[card] = self.__counts.get(card, 0) + 1
+
+    # pickle and deepcopy rebuild the hand from its cards
+    def __reduce__(self):
+        return CountHand, (list(self),)
+
+    def __contains__(self, card: object) -> bool:
+        return card in self.__counts
+
+    def append(self, card: Card):
+        list.append(self, card)
+        counts = self.__counts
+        counts[card] = counts.get(card, 0) + 1
+
+    def extend(self, cards: Iterable[Card]):
+        cards = list(cards)
+        list.extend(self, cards)
+        counts = self.__counts
+        for card in cards:
+            counts[card] = counts.get(card, 0) + 1
+
+    def insert(self, position: int, card: Card):
+        list.insert(self, position, card)
+        counts = self.__counts
+        counts[card] = counts.get(card, 0) + 1
+
+    def remove(self, card: Card):
+        list.remove(self, card)
+        self.__discount(card)
+
+    def pop(self, position: int = -1) -> Card:
+        card = list.pop(self, position)
+        self.__discount(card)
+        return card
+
+    def count(self, card: Card) -> int:
+        return self.__counts.get(card, 0)
+
+    def clear(self):
+        list.clear(self)
+        self.__counts.clear()
+
+    def copy(self) -> "CountHand":
+        hand = CountHand.__new__(CountHand)
+        list.extend(hand, self)
+        hand.__counts = self.__counts.copy()
+        return hand
+
+    def __discount(self, card: Card):
+        counts = self.__counts
+        count = counts[card]
+        if count == 1:
+            del counts[card]
+        else:
+            counts[card] = count - 1
+
+
+def create_hand(cards: list[Card], hand_store: str = "list") -> list[Card] | CountHand:
+    match hand_store:
+        case "list":
+            return cards
+        case "counts":
+            return CountHand(cards)
+        case _:
+            raise Exception(f"Unknown hand store {hand_store}. Allowable options (list, counts)")
@@ -3,12 +3,12 @@ import random
 from enum import Enum
 from typing import Union
 
-from src.game.Card import Card, CardID, CardType
+from src.game.Card import Card, CardType, SCOPE, MUSTANG
 from src.game.Deck import Deck
+from src.game.Hand import CountHand
 from src.game.Role import Role
 from src.game.Utils import GameEncoder
 
-
 class PlayerActionResponse(Enum):
     BANG = "bang"
     MISS = "miss"
@@ -16,8 +16,9 @@ class PlayerActionResponse(Enum):
 
 
 class Player:
-    def __init__(self, deck: Deck, hand: list[Card], player_config):
+    def __init__(self, deck: Deck, hand: Union[list[Card], CountHand], player_config, rng: random.Random):
         self.__deck = deck
+        self.__rng = rng
         self.name = player_config.name
         self.__role = Role(player_config.role)
         self.__hand = hand
@@ -54,12 +55,55 @@ class Player:
 
         """)
 
+    def snapshot(self) -> tuple:
+        return (self.__hand.copy(), self.__cur_hp, self.__weapon, self.__weapon_range,
+                self.can_use_weapon, self.__effects.copy())
+
+    def restore(self, snapshot: tuple):
+        hand, self.__cur_hp, self.__weapon, self.__weapon_range, self.can_use_weapon, effects = snapshot
+        self.__hand = hand.copy()
+        self.__effects = effects.copy()
+
+    def clone(self, deck: Deck, rng: random.Random) -> "Player":
+        player = Player.__new__(Player)
+        player.__deck = deck
+        player.__rng = rng
+        player.name = self.name
+        player.__role = self.__role
+        player.__max_hp = self.__max_hp
+        player.restore(self.snapshot())
+        return player
+
     def get_dist_modifiers(self):
         return {
-            "for_shoot": 1 if Card(CardID.SCOPE) in self.__effects else 0,
-            "for_save": 1 if Card(CardID.MUSTANG) in self.__effects else 0,
+            "for_shoot": self.get_shoot_modifier(),
+            "for_save": self.get_save_modifier(),
                 }
 
+    def get_shoot_modifier(self) -> int:
+        return 1 if SCOPE in self.__effects else 0
+
+    def get_save_modifier(self) -> int:
+        return 1 if MUSTANG in self.__effects else 0
+
+    def get_role(self) -> Role:
+        return self.__role
+
+    def get_max_health(self) -> int:
+        return self.__max_hp
+
+    def get_weapon(self) -> Union[Card, str]:
+        return self.__weapon
+
+    def get_weapon_range(self) -> int:
+        return self.__weapon_range
+
+    def get_hand(self) -> Union[list[Card], CountHand]:
+        return self.__hand
+
+    def get_effects(self) -> list[Card]:
+        return self.__effects
+
     def has_card(self, card: Card) -> bool:
         return card in self.__hand
 
@@ -67,7 +111,7 @@ class Player:
         self.__hand.append(card)
 
     def get_random_card_from_hand(self) -> Card:
-        return self.__hand.pop(random.randrange(len(self.__hand)))
+        return self.__hand.pop(self.__rng.randrange(len(self.__hand)))
 
     def get_card_from_game(self, card: Card) -> Card:
         match card.card_type:
@@ -113,7 +157,7 @@ class Player:
     def death(self):
         for card in self.__hand:
             self.__deck.discard(card)
-        self.__hand = []
+        self.__hand.clear()
         for card in self.__effects:
             self.__deck.discard(card)
         self.__effects = []
@@ -142,7 +186,9 @@ class Player:
 
     def draw_cards(self, num_cards: int):
         for i in range(num_cards):
-            self.__hand.append(self.__deck.draw())
+            card = self.__deck.draw()
+            if card is not None:
+                self.__hand.append(card)
 
     def start_of_turn(self):
         self.draw_cards(2)
@@ -0,0 +1,74 @@
+from src.game.Player import Player
+
+
+# Seating ring of the alive players with an all-pairs distance matrix.
+# Distance = seats between the players around the table + opponent's mustang - player's scope.
+# The matrix is rebuilt only when a player leaves the table and patched when someone's effects change,
+# so distance and reachability queries are plain dict lookups.
+class Seating:
+    def __init__(self, players: dict[str, Player], order: list[str]):
+        self.__players = players
+        self.__order = order
+        self.__seats = {}
+        self.__distances = {}
+        self.__rebuild()
+
+    # Seats and the distance matrix as plain dicts for the snapshots of the game
+    def get_state(self) -> tuple[dict[str, int], dict[str, dict[str, int]]]:
+        return self.__seats.copy(), {name: row.copy() for name, row in self.__distances.items()}
+
+    # Seating restored from get_state, the matrix is copied instead of rebuilt
+    @staticmethod
+    def from_state(players: dict[str, Player], order: list[str],
+                   state: tuple[dict[str, int], dict[str, dict[str, int]]]) -> "Seating":
+        seating = Seating.__new__(Seating)
+        seating.__players = players
+        seating.__order = order
+        seats, distances = state
+        seating.__seats = seats.copy()
+        seating.__distances = {name: row.copy() for name, row in distances.items()}
+        return seating
+
+    # Copy for the players of a cloned game, `order` is the players order list of that game
+    def clone(self, players: dict[str, Player], order: list[str]) -> "Seating":
+        return Seating.from_state(players, order, (self.__seats, self.__distances))
+
+    def __rebuild(self):
+        self.__seats = {name: seat for seat, name in enumerate(self.__order)}
+        self.__distances = {name: self.__get_row(name) for name in self.__order}
+
+    def __get_row(self, name: str) -> dict[str, int]:
+        shoot_modifier = self.__players[name].get_shoot_modifier()
+        return {opponent: self.__ring_distance(name, opponent)
+                + self.__players[opponent].get_save_modifier() - shoot_modifier
+                for opponent in self.__order if opponent != name}
+
+    def get_order(self) -> list[str]:
+        return self.__order
+
+    def distance(self, name: str, opponent: str) -> int:
+        return self.__distances[name][opponent]
+
+    def get_reachable(self, name: str, max_distance: int) -> list[str]:
+        return [opponent for opponent, dist in self.__distances[name].items() if dist <= max_distance]
+
+    def update_player(self, name: str):
+        if name not in self.__seats:
+            return
+        # scope changes the player's row, mustang changes the player's column
+        self.__distances[name] = self.__get_row(name)
+        save_modifier = self.__players[name].get_save_modifier()
+        for opponent, row in self.__distances.items():
+            if opponent != name:
+                row[name] = (self.__ring_distance(opponent, name) + save_modifier
+                             - self.__players[opponent].get_shoot_modifier())
+
+    def remove(self, name: str) -> int:
+        seat = self.__seats[name]
+        del self.__order[seat]
+        self.__rebuild()
+        return seat
+
+    def __ring_distance(self, name: str, opponent: str) -> int:
+        dist = abs(self.__seats[name] - self.__seats[opponent])
+        return min(dist, len(self.__order) - dist)
@@ -5,19 +5,23 @@ from enum import Enum
 from json import JSONEncoder
 
 from src.game.Card import Card
+from src.game.Hand import CARDS
 from src.game.Role import Role
 
+# cards are the most frequent objects in logs, their JSON form is built once
+CARDS_JSON = {card: {"card_id": card.card_id.value, "card_type": card.card_type.value} for card in CARDS}
+
 
 class GameEncoder(JSONEncoder):
     def default(self, obj):
+        if type(obj) is Card:
+            return CARDS_JSON[obj]
         if isinstance(obj, Enum):
             return {"name": obj.name, "value": obj.value}
         if isinstance(obj, deque):
             return list(obj)
         if isinstance(obj, datetime.datetime):
             return obj.isoformat()
-        if isinstance(obj, Card):
-            return {"card_id": obj.card_id.value, "card_type": obj.card_type.value}
         return super().default(obj)
 
 def check_player_roles(config):
@@ -45,6 +49,10 @@ def check_player_roles(config):
         if role_n != 0:
             raise Exception("The set of roles does not correspond to the rules and the number of players")
 
-def shuffle(items):
-    random.shuffle(items)
+def shuffle(items, rng: random.Random):
+    rng.shuffle(items)
+
+def get_run_seed(base_seed: int, run_index: int) -> int:
+    # every run of an experiment gets its own reproducible seed
+    return base_seed + run_index
 
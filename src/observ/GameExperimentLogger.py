@@ -2,50 +2,99 @@ import hashlib
 import json
 import os
 import uuid
+from typing import Any, Optional
 
-from omegaconf import OmegaConf
+from omegaconf import OmegaConf, DictConfig
 import mlflow
+from mlflow import MlflowClient
 
+from src.agent.LlmUsage import LlmUsage
 from src.game.Config import Config
+from src.game.Utils import get_run_seed
 
 
+# Every logger works with its own run id through MlflowClient instead of the global active run,
+# so several games can be logged from one process at the same time
 class GameExperimentLogger:
-    def __init__(self):
-        self.__prepare_for_experiment()
+    def __init__(self, config: DictConfig, run_index: Optional[int] = None, run_id: Optional[str] = None):
+        self.config = config
+        self.__client = MlflowClient()
+        self.__experiment_id = None
+        self.run_id = run_id
+        if run_id is None:
+            self.run_index = self.__prepare_for_experiment(run_index)
+        else:
+            # a resumed game keeps its save folder and its mlflow run
+            self.run_index = run_index
+            self.__experiment_id = self.__client.get_run(run_id).info.experiment_id
+        self.run_seed = get_run_seed(self.config.seed, self.run_index)
 
-    @staticmethod
-    def start_run():
-        run_name = os.path.basename(Config().config.save_path)
-        mlflow.start_run(run_name=run_name)
-        config = OmegaConf.to_container(Config().config, resolve=True)
-        GameExperimentLogger.__set_run_tags(config)
-        mlflow.log_dict(config, "config.json")
+    def start_run(self):
+        run_name = os.path.basename(self.config.save_path)
+        config = OmegaConf.to_container(self.config, resolve=True)
+        run = self.__client.create_run(self.__experiment_id, run_name=run_name,
+                                       tags=GameExperimentLogger.__get_run_tags(config))
+        self.run_id = run.info.run_id
+        self.__client.log_param(self.run_id, "run_index", self.run_index)
+        self.__client.log_param(self.run_id, "run_seed", self.run_seed)
+        self.__client.log_dict(self.run_id, config, "config.json")
+
+    def resume_run(self):
+        self.__client.update_run(self.run_id, status="RUNNING")
 
     @staticmethod
-    def __set_run_tags(config: dict):
+    def __get_run_tags(config: dict) -> dict[str, str]:
         tags = {"players_number": int(config["players_number"])}
         agent_types = []
         for agent in config["agents"].values():
             agent_types.append(agent["agent_type"])
         tags["agent_types"] = sorted(set(agent_types))
         tags["num_agent_types"] = len(set(agent_types))
-        mlflow.set_tags(tags)
+        return {key: str(value) for key, value in tags.items()}
 
+    def log_metrics(self, metrics: dict[str, float]):
+        for key, value in metrics.items():
+            self.__client.log_metric(self.run_id, key, value)
+
+    # llm_usage (LlmUsage.merge of the agents) goes to the metrics of the run
+    def end_run(self, llm_usage: Optional[dict[str, Any]] = None):
+        if llm_usage:
+            self.log_metrics(LlmUsage.get_metrics(llm_usage))
+        self.__client.log_artifacts(self.run_id, self.config.save_path, "logs")
+        self.__client.set_terminated(self.run_id)
+
+    # Checks the config against the experiment, creates the mlflow experiment if needed
+    # and returns the number of runs already in it
     @staticmethod
-    def end_run():
-        mlflow.log_artifacts(Config().config.save_path, "logs")
-        mlflow.end_run()
+    def prepare_experiment(config: DictConfig) -> int:
+        Config.set_git_commit_hash(config)
+        GameExperimentLogger.__check_config_hash(config)
+        mlflow.set_experiment(config.exp_name)
+        return len([entry for entry in os.scandir(config.save_path) if entry.is_dir()])
 
+    # Summary of the runs finished by one launch of run_experiment.py
     @staticmethod
-    def __prepare_for_experiment():
-        Config.set_git_commit_hash()
-        GameExperimentLogger.__check_config_hash()
-        exp_path = Config().config.save_path
+    def log_experiment_summary(config: DictConfig, params: dict[str, int], metrics: dict[str, int]):
+        client = MlflowClient()
+        experiment_id = mlflow.set_experiment(config.exp_name).experiment_id
+        run = client.create_run(experiment_id, run_name=f"{config.exp_name}_summary", tags={"summary": "true"})
+        for key, value in params.items():
+            client.log_param(run.info.run_id, key, value)
+        for key, value in metrics.items():
+            client.log_metric(run.info.run_id, key, value)
+        client.set_terminated(run.info.run_id)
+
+    def __prepare_for_experiment(self, run_index: Optional[int] = None) -> int:
+        runs_number = GameExperimentLogger.prepare_experiment(self.config)
+        if run_index is None:
+            run_index = runs_number
+        exp_path = self.config.save_path
         run_id = str(uuid.uuid4())
-        Config().config.save_path = os.path.join(exp_path, run_id)
-        run_path = Config().config.save_path
+        self.config.save_path = os.path.join(exp_path, run_id)
+        run_path = self.config.save_path
         os.makedirs(run_path)
-        mlflow.set_experiment(Config().config.exp_name)
+        self.__experiment_id = mlflow.set_experiment(self.config.exp_name).experiment_id
+        return run_index
 
 
     @staticmethod
@@ -54,8 +103,8 @@ class GameExperimentLogger:
         return hashlib.sha256(json_str.encode()).hexdigest()
 
     @staticmethod
-    def __check_config_hash():
-        config = OmegaConf.to_container(Config().config, resolve=True)
+    def __check_config_hash(config: DictConfig):
+        config = OmegaConf.to_container(config, resolve=True)
         exp_save_path = config["save_path"]
         exp_hash = GameExperimentLogger.__get_config_hash(config)
         hash_file_path = os.path.join(exp_save_path, 'exp_hash.txt')
@@ -68,4 +117,4 @@ class GameExperimentLogger:
         else:
             os.makedirs(exp_save_path)
             with open(hash_file_path, 'w') as f:
-                f.write(exp_hash)
\ No newline at end of file
+                f.write(exp_hash)
@@ -0,0 +1,101 @@
+import atexit
+import os
+import threading
+import time
+from typing import Any
+from zoneinfo import ZoneInfo
+
+from src.game.Utils import GameEncoder
+
+LOG_TIMEZONE = ZoneInfo("Europe/Moscow")
+
+
+# Append-only JSONL sink with a persistent file handle.
+# Events are serialized right away on the caller's thread (they may change later),
+# kept in memory and written by one background thread for all writers:
+# every FLUSH_INTERVAL seconds, as soon as a buffer grows over BUFFER_SIZE and at exit.
+# Written data is fsynced at most every FSYNC_INTERVAL seconds, so a crash loses only the last moments.
+class JsonlWriter:
+    BUFFER_SIZE = 1 << 16
+    FLUSH_INTERVAL = 1.0
+    FSYNC_INTERVAL = 5.0
+
+    __encoder = GameEncoder()
+    __writers: set["JsonlWriter"] = set()
+    __writers_lock = threading.Lock()
+    __flush_event = threading.Event()
+    __flush_thread = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = open(path, "a", encoding="utf-8")
+        self.__buffer = []
+        self.__buffer_size = 0
+        self.__buffer_lock = threading.Lock()
+        self.__file_lock = threading.Lock()
+        self.__last_fsync = time.monotonic()
+        JsonlWriter.__register(self)
+
+    def write(self, data: dict[str, Any]):
+        line = JsonlWriter.__encoder.encode(data) + "\n"
+        with self.__buffer_lock:
+            self.__buffer.append(line)
+            self.__buffer_size += len(line)
+            buffer_size = self.__buffer_size
+        if buffer_size >= JsonlWriter.BUFFER_SIZE:
+            JsonlWriter.__flush_event.set()
+
+    def flush(self, fsync: bool = False):
+        with self.__file_lock:
+            if self.__file.closed:
+                return
+            with self.__buffer_lock:
+                lines, self.__buffer, self.__buffer_size = self.__buffer, [], 0
+            if lines:
+                self.__file.write("".join(lines))
+                self.__file.flush()
+            if fsync or time.monotonic() - self.__last_fsync >= JsonlWriter.FSYNC_INTERVAL:
+                os.fsync(self.__file.fileno())
+                self.__last_fsync = time.monotonic()
+
+    # size of the file with everything written so far, checkpoints use it to cut off later events
+    def tell(self) -> int:
+        self.flush(fsync=True)
+        with self.__file_lock:
+            return self.__file.tell()
+
+    def close(self):
+        self.flush(fsync=True)
+        with self.__file_lock:
+            self.__file.close()
+        with JsonlWriter.__writers_lock:
+            JsonlWriter.__writers.discard(self)
+
+    @staticmethod
+    def close_all():
+        with JsonlWriter.__writers_lock:
+            writers = list(JsonlWriter.__writers)
+        for writer in writers:
+            writer.close()
+
+    @staticmethod
+    def __register(writer: "JsonlWriter"):
+        with JsonlWriter.__writers_lock:
+            JsonlWriter.__writers.add(writer)
+            if JsonlWriter.__flush_thread is None:
+                JsonlWriter.__flush_thread = threading.Thread(target=JsonlWriter.__flush_loop,
+                                                              name="jsonl-writer", daemon=True)
+                JsonlWriter.__flush_thread.start()
+
+    @staticmethod
+    def __flush_loop():
+        while True:
+            JsonlWriter.__flush_event.wait(JsonlWriter.FLUSH_INTERVAL)
+            JsonlWriter.__flush_event.clear()
+            with JsonlWriter.__writers_lock:
+                writers = list(JsonlWriter.__writers)
+            for writer in writers:
+                writer.flush()
+
+
+atexit.register(JsonlWriter.close_all)
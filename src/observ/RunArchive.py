@@ -0,0 +1,168 @@
+import fnmatch
+import json
+import os
+import struct
+import zlib
+from typing import Any, Iterator
+
+ARCHIVE_NAME = "run.bangrun"
+JSONL_FILES = ("game_log.json", "shared_memory_log.json", "local_log.json", "llm_calls.json")
+
+
+# One file per run instead of game_init + game/shared memory logs + a local log per agent.
+# Layout: MAGIC | frames | TOC | TOC offset (8 bytes) | MAGIC
+# Every file is split into records (lines for JSONL logs, the whole file otherwise),
+# records are length prefixed (4 bytes) and packed into zlib frames of about FRAME_SIZE bytes,
+# so prompts repeated across records compress well. The TOC (zlib compressed JSON) maps
+# file names to their frames: [offset, compressed size, records].
+class RunArchiveWriter:
+    MAGIC = b"BANGRUN1"
+    FRAME_SIZE = 1 << 20
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = open(path, "wb")
+        self.__file.write(RunArchiveWriter.MAGIC)
+        self.__toc = {}
+
+    def add_file(self, name: str, data: bytes):
+        records = data.split(b"\n") if os.path.basename(name) in JSONL_FILES else [data]
+        frames = []
+        frame = []
+        frame_size = 0
+        for record in records:
+            frame.append(struct.pack(">I", len(record)))
+            frame.append(record)
+            frame_size += len(record) + 4
+            if frame_size >= RunArchiveWriter.FRAME_SIZE:
+                frames.append(self.__write_frame(frame))
+                frame, frame_size = [], 0
+        if frame:
+            frames.append(self.__write_frame(frame))
+        self.__toc[name] = {"size": len(data), "records": len(records), "frames": frames}
+
+    def close(self):
+        toc_offset = self.__file.tell()
+        self.__file.write(zlib.compress(json.dumps(self.__toc, separators=(",", ":")).encode("utf-8")))
+        self.__file.write(struct.pack(">Q", toc_offset))
+        self.__file.write(RunArchiveWriter.MAGIC)
+        self.__file.close()
+
+    def __write_frame(self, frame: list[bytes]) -> list[int]:
+        data = zlib.compress(b"".join(frame))
+        offset = self.__file.tell()
+        self.__file.write(data)
+        return [offset, len(data), len(frame) // 2]
+
+
+class RunArchive:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic = f.read(len(RunArchiveWriter.MAGIC))
+            f.seek(-len(RunArchiveWriter.MAGIC) - 8, os.SEEK_END)
+            toc_end = f.tell()
+            toc_offset, = struct.unpack(">Q", f.read(8))
+            end_magic = f.read()
+            if magic != RunArchiveWriter.MAGIC or end_magic != RunArchiveWriter.MAGIC:
+                raise Exception(f"{path} is not a run archive")
+            f.seek(toc_offset)
+            self.__toc = json.loads(zlib.decompress(f.read(toc_end - toc_offset)))
+
+    def names(self, pattern: str = "*") -> list[str]:
+        return [name for name in self.__toc if fnmatch.fnmatch(name, pattern)]
+
+    def read_records(self, name: str) -> Iterator[bytes]:
+        if name not in self.__toc:
+            raise Exception(f"{name} is not in the run archive {self.path}")
+        with open(self.path, "rb") as f:
+            for offset, size, records in self.__toc[name]["frames"]:
+                f.seek(offset)
+                frame = zlib.decompress(f.read(size))
+                position = 0
+                for _ in range(records):
+                    length, = struct.unpack_from(">I", frame, position)
+                    yield frame[position + 4:position + 4 + length]
+                    position += 4 + length
+
+    def read_bytes(self, name: str) -> bytes:
+        return b"\n".join(self.read_records(name))
+
+    def read_jsonl(self, name: str) -> list[dict[str, Any]]:
+        return [json.loads(record) for record in self.read_records(name) if record.strip()]
+
+    def read_json(self, name: str) -> Any:
+        return json.loads(self.read_bytes(name))
+
+
+def pack_run(run_path: str, remove: bool = False) -> str:
+    archive_path = os.path.join(run_path, ARCHIVE_NAME)
+    names = []
+    for root, _, files in os.walk(run_path):
+        for file_name in files:
+            name = os.path.relpath(os.path.join(root, file_name), run_path).replace(os.sep, "/")
+            if name != ARCHIVE_NAME:
+                names.append(name)
+
+    writer = RunArchiveWriter(archive_path + ".tmp")
+    for name in sorted(names):
+        with open(os.path.join(run_path, name), "rb") as f:
+            writer.add_file(name, f.read())
+    writer.close()
+    os.replace(archive_path + ".tmp", archive_path)
+
+    if remove:
+        for name in names:
+            os.remove(os.path.join(run_path, name))
+        for root, dirs, _ in os.walk(run_path, topdown=False):
+            for dir_name in dirs:
+                dir_path = os.path.join(root, dir_name)
+                if not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+    return archive_path
+
+
+def unpack_run(run_path: str, remove: bool = False):
+    archive_path = os.path.join(run_path, ARCHIVE_NAME)
+    archive = RunArchive(archive_path)
+    for name in archive.names():
+        path = os.path.join(run_path, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(archive.read_bytes(name))
+    if remove:
+        os.remove(archive_path)
+
+
+# Readers for both layouts: the run archive if the run was packed, plain files otherwise
+def read_run_jsonl(run_path: str, name: str) -> list[dict[str, Any]]:
+    archive_path = os.path.join(run_path, ARCHIVE_NAME)
+    if os.path.exists(archive_path):
+        return RunArchive(archive_path).read_jsonl(name)
+    data = []
+    with open(os.path.join(run_path, name), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data.append(json.loads(line))
+    return data
+
+
+def read_run_json(run_path: str, name: str) -> Any:
+    archive_path = os.path.join(run_path, ARCHIVE_NAME)
+    if os.path.exists(archive_path):
+        return RunArchive(archive_path).read_json(name)
+    with open(os.path.join(run_path, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_run_files(run_path: str, pattern: str) -> list[str]:
+    archive_path = os.path.join(run_path, ARCHIVE_NAME)
+    if os.path.exists(archive_path):
+        return RunArchive(archive_path).names(pattern)
+    names = []
+    for root, _, files in os.walk(run_path):
+        for file_name in files:
+            name = os.path.relpath(os.path.join(root, file_name), run_path).replace(os.sep, "/")
+            if fnmatch.fnmatch(name, pattern):
+                names.append(name)
+    return sorted(names)
@@ -0,0 +1,144 @@
+from collections import deque
+from enum import Enum
+from typing import Any, Optional
+
+from src.game.Card import Card
+from src.game.Utils import CARDS_JSON
+
+
+# Game states are logged as a full keyframe every `keyframe_interval` states and as deltas in between.
+# Delta format (JSON compatible, None - nothing changed):
+#   {"=": value}                        - replace the value
+#   {"{": {key: delta}, "-": [keys]}    - patch a dict, "-" lists removed keys
+#   {"#": {"index": delta}}             - patch items of a list with the same length
+#   {"[": [start, stop, items]}         - replace list[start:stop] with items
+def to_plain(value: Any) -> Any:
+    if type(value) is Card:
+        return CARDS_JSON[value]
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, deque)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, Enum):
+        return {"name": value.name, "value": value.value}
+    return value
+
+
+def diff_state(old: Any, new: Any) -> Optional[dict[str, Any]]:
+    if type(old) is not type(new):
+        return {"=": new}
+    if isinstance(new, dict):
+        patch = {}
+        for key, value in new.items():
+            delta = diff_state(old[key], value) if key in old else {"=": value}
+            if delta is not None:
+                patch[key] = delta
+        removed = [key for key in old if key not in new]
+        if not patch and not removed:
+            return None
+        delta = {"{": patch}
+        if removed:
+            delta["-"] = removed
+        return delta
+    if isinstance(new, list):
+        return _diff_list(old, new)
+    return None if old == new else {"=": new}
+
+
+def _diff_list(old: list, new: list) -> Optional[dict[str, Any]]:
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    if start == len(old) == len(new):
+        return None
+    end = 0
+    while end < limit - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    if len(old) == len(new):
+        # e.g. one player changed in the players list: patch only that player
+        patch = {}
+        for index in range(start, len(new) - end):
+            delta = diff_state(old[index], new[index])
+            if delta is not None:
+                patch[str(index)] = delta
+        return {"#": patch}
+    return {"[": [start, len(old) - end, new[start:len(new) - end]]}
+
+
+# Returns a new state, unchanged parts are shared with the old one, so states must not be modified in place
+def apply_delta(state: Any, delta: Optional[dict[str, Any]]) -> Any:
+    if delta is None:
+        return state
+    if "=" in delta:
+        return delta["="]
+    if "{" in delta:
+        state = dict(state)
+        for key in delta.get("-", []):
+            del state[key]
+        for key, item_delta in delta["{"].items():
+            state[key] = apply_delta(state.get(key), item_delta)
+        return state
+    if "#" in delta:
+        state = list(state)
+        for index, item_delta in delta["#"].items():
+            state[int(index)] = apply_delta(state[int(index)], item_delta)
+        return state
+    start, stop, items = delta["["]
+    return state[:start] + items + state[stop:]
+
+
+class StateDeltaEncoder:
+    def __init__(self, keyframe_interval: int):
+        self.__keyframe_interval = keyframe_interval
+        self.__state = None
+        self.__since_keyframe = 0
+
+    # (True, full state) for a keyframe, (False, delta from the previous state) otherwise
+    def encode(self, state: dict[str, Any]) -> tuple[bool, Any]:
+        state = to_plain(state)
+        previous, self.__state = self.__state, state
+        self.__since_keyframe += 1
+        if previous is None or self.__since_keyframe >= self.__keyframe_interval:
+            self.__since_keyframe = 0
+            return True, state
+        return False, diff_state(previous, state)
+
+
+# Rebuilds any logged state on demand from the nearest keyframe before it
+class StateHistory:
+    def __init__(self):
+        self.__keyframes = {}
+        self.__deltas = []
+        self.__cached_index = None
+        self.__cached_state = None
+
+    def __len__(self) -> int:
+        return len(self.__deltas)
+
+    def add_keyframe(self, state: dict[str, Any]):
+        self.__keyframes[len(self.__deltas)] = state
+        self.__deltas.append(None)
+
+    def add_delta(self, delta: Optional[dict[str, Any]]):
+        if not self.__keyframes:
+            raise Exception("State delta before the first keyframe")
+        self.__deltas.append(delta)
+
+    def get(self, index: int) -> dict[str, Any]:
+        if index < 0:
+            index += len(self.__deltas)
+        if not 0 <= index < len(self.__deltas):
+            raise IndexError(f"State {index} is out of range, states logged: {len(self.__deltas)}")
+        if self.__cached_index is not None and self.__cached_index <= index:
+            start, state = self.__cached_index, self.__cached_state
+        else:
+            start = max(keyframe for keyframe in self.__keyframes if keyframe <= index)
+            state = self.__keyframes[start]
+        for step in range(start + 1, index + 1):
+            state = self.__keyframes[step] if step in self.__keyframes else apply_delta(state, self.__deltas[step])
+        self.__cached_index, self.__cached_state = index, state
+        return state
+
+    def last(self) -> dict[str, Any]:
+        return self.get(-1)